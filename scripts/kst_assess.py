@@ -0,0 +1,424 @@
+"""
+KST Assessment Service — Adaptive Testing for Many Students at Once
+
+Runs live adaptive assessments against one knowledge graph:
+- One shared BlimModel; each student's posterior is a row of an
+  AssessmentSessionPool
+- Requests arriving within a short window (--batch-window) are applied as
+  one batch on a worker thread: a vectorized posterior update, one entropy
+  pass and one expected-entropy item selection for every affected session,
+  so the event loop never runs BLIM arithmetic itself
+- A session ends when the entropy of its posterior drops to --min-entropy
+  bits, after --max-items questions, or when every item has been asked
+- assessment_log entries, the final current_state and a history entry are
+  written back to the graph every --flush-interval seconds (and on
+  shutdown) instead of once per answer
+
+Protocol: newline-delimited JSON-RPC 2.0 (as in `kst_utils.py serve`) on a
+Unix socket or a localhost TCP port. Requests on one connection may be
+pipelined; responses carry the request id.
+
+    start    {"student": ID}                                -> session
+    answer   {"student": ID, "item": ID, "correct": bool}   -> session
+    finish   {"student": ID}                                -> session
+    status   {}   flush {}   shutdown {}
+
+where session is {"student", "item" (next question, or null), "done",
+"entropy", "asked"} plus "state" (the current_state written) once done.
+
+Usage:
+    python3 scripts/kst_assess.py <graph-path> [--socket PATH | --port N]
+        [--min-entropy BITS] [--max-items N] [--flush-interval SECONDS]
+        [--batch-window SECONDS]
+"""
+
+import asyncio
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Any
+
+from kst_utils import (
+    AssessmentSessionPool,
+    BlimModel,
+    load_graph,
+    remove_stale_socket,
+    save_graph,
+)
+
+
+class SessionError(ValueError):
+    """A request that does not fit the student's session (JSON-RPC -32000)."""
+
+
+class AssessmentService:
+    """
+    Asyncio front end for many concurrent assessments over one graph.
+
+    Every pool operation runs on a single compute thread, in batches
+    collected over batch_window seconds, so the pool needs no locking and
+    sessions answering at the same moment share one vectorized update.
+    Graph writes run in a writer process holding its own copy of the graph,
+    so serializing a large file never holds this process's GIL.
+    """
+
+    def __init__(
+        self,
+        graph_path: str,
+        min_entropy: float = 1.0,
+        max_items: int | None = None,
+        flush_interval: float = 2.0,
+        batch_window: float = 0.002
+    ):
+        self.graph_path = graph_path
+        self.graph = load_graph(graph_path)
+        self.model = BlimModel.from_graph(self.graph)
+        self.pool = AssessmentSessionPool(self.model)
+        self.min_entropy = min_entropy
+        self.max_items = max_items if max_items is not None else len(self.model.item_ids)
+        self.flush_interval = flush_interval
+        self.batch_window = batch_window
+        # Stored states are referenced by ID; enumerated ones by their items.
+        self._state_ids = bool(self.graph.get("knowledge_states"))
+        self._compute = ThreadPoolExecutor(1, thread_name_prefix="kst-blim")
+        self._writer = ProcessPoolExecutor(1, initializer=_writer_init,
+                                           initargs=(graph_path,))
+        self._pending: dict[str, str | None] = {}  # student -> item awaiting an answer
+        self._queue: list[tuple[tuple, asyncio.Future]] = []
+        self._drain_task: asyncio.Task | None = None
+        self._dirty: dict[str, dict[str, Any]] = {}
+        self.stopped = asyncio.Event()  # set by the shutdown request
+        self.stats = {"answers": 0, "batches": 0, "largest_batch": 0,
+                      "completed": 0, "flushes": 0}
+
+    # --- Session API -------------------------------------------------------
+
+    async def start(self, student_id: str) -> dict[str, Any]:
+        """Open a session at the prior and return the first question."""
+        if student_id in self._pending:
+            raise SessionError(f"Session already open: {student_id}")
+        self._pending[student_id] = None
+        try:
+            return self._settle(await self._submit(("start", student_id)))
+        except Exception:
+            self._pending.pop(student_id, None)
+            raise
+
+    async def answer(self, student_id: str, item_id: str,
+                     correct: bool) -> dict[str, Any]:
+        """Record the answer to the outstanding question and return the next."""
+        if student_id not in self._pending:
+            raise SessionError(f"No open session: {student_id}")
+        expected = self._pending[student_id]
+        if expected != item_id:
+            raise SessionError(f"Expected an answer to {expected}, got {item_id}")
+        self._pending[student_id] = None
+        self._record(student_id, {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "item_id": item_id,
+            "response": "correct" if correct else "incorrect",
+        })
+        self.stats["answers"] += 1
+        return self._settle(await self._submit(("answer", student_id, item_id, correct)))
+
+    async def finish(self, student_id: str) -> dict[str, Any]:
+        """End a session early, recording its most likely state."""
+        if student_id not in self._pending:
+            raise SessionError(f"No open session: {student_id}")
+        self._pending[student_id] = None
+        return self._settle(await self._submit(("finish", student_id)))
+
+    async def flush(self) -> int:
+        """Write pending logs and states to the graph; returns students written."""
+        if not self._dirty:
+            return 0
+        pending, self._dirty = self._dirty, {}
+        await asyncio.get_running_loop().run_in_executor(
+            self._writer, _writer_save, pending)
+        self.stats["flushes"] += 1
+        return len(pending)
+
+    async def run_flusher(self) -> None:
+        """Flush every flush_interval seconds until cancelled."""
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def close(self) -> None:
+        """Flush outstanding writes and stop the compute thread and writer process."""
+        await self.flush()
+        self._compute.shutdown()
+        self._writer.shutdown()
+
+    def status(self) -> dict[str, Any]:
+        return dict(self.stats, open_sessions=len(self._pending),
+                    unflushed_students=len(self._dirty))
+
+    # --- Batching ----------------------------------------------------------
+
+    async def _submit(self, op: tuple) -> dict[str, Any]:
+        future = asyncio.get_running_loop().create_future()
+        self._queue.append((op, future))
+        if self._drain_task is None:
+            self._drain_task = asyncio.ensure_future(self._drain())
+        return await future
+
+    async def _drain(self) -> None:
+        await asyncio.sleep(self.batch_window)
+        batch, self._queue = self._queue, []
+        self._drain_task = None
+        self.stats["batches"] += 1
+        self.stats["largest_batch"] = max(self.stats["largest_batch"], len(batch))
+        try:
+            results = await asyncio.get_running_loop().run_in_executor(
+                self._compute, self._run_batch, [op for op, _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), result in zip(batch, results):
+            if future.done():  # the requesting connection went away
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+    def _run_batch(self, ops: list[tuple]) -> list[dict[str, Any] | Exception]:
+        """
+        Apply one batch on the compute thread; one result per op, or a
+        SessionError for ops on a session an earlier batch already closed.
+        """
+        pool = self.pool
+        events = []
+        for op in ops:
+            if op[0] == "start":
+                pool.open(op[1])
+            elif op[0] == "answer" and op[1] in pool:
+                events.append(op[1:])
+        pool.process(events)
+
+        active = [sid for sid in dict.fromkeys(op[1] for op in ops) if sid in pool]
+        entropies = dict(zip(active, pool.entropies(active)))
+        finished = {op[1] for op in ops if op[0] == "finish"}
+        for sid in active:
+            if (entropies[sid] <= self.min_entropy
+                    or bin(pool.asked[sid]).count("1") >= self.max_items):
+                finished.add(sid)
+        next_items = pool.next_items([sid for sid in active if sid not in finished])
+
+        sessions = {}
+        for sid in active:
+            session = {"student": sid, "entropy": entropies[sid],
+                       "asked": bin(pool.asked[sid]).count("1"),
+                       "item": next_items.get(sid), "done": False}
+            if sid in finished or session["item"] is None:
+                state_id, items = pool.most_likely_state(sid)
+                pool.close(sid)
+                session.update(item=None, done=True,
+                               state=state_id if self._state_ids else items)
+            sessions[sid] = session
+        return [sessions.get(op[1]) or SessionError(f"Session already closed: {op[1]}")
+                for op in ops]
+
+    def _settle(self, session: dict[str, Any]) -> dict[str, Any]:
+        """Update loop-side bookkeeping from a batch result."""
+        sid = session["student"]
+        if session["done"]:
+            if sid in self._pending:
+                del self._pending[sid]
+                self.stats["completed"] += 1
+                now = datetime.now(timezone.utc).isoformat()
+                record = self._dirty.setdefault(sid, {"log": []})
+                record["state"] = session["state"]
+                record["history"] = {"timestamp": now, "state": session["state"],
+                                     "trigger": "assessment"}
+        else:
+            self._pending[sid] = session["item"]
+        return session
+
+    def _record(self, student_id: str, entry: dict) -> None:
+        self._dirty.setdefault(student_id, {"log": []})["log"].append(entry)
+
+    # --- JSON-RPC ----------------------------------------------------------
+
+    async def handle(self, line: str) -> dict | None:
+        """Answer one JSON-RPC 2.0 request line; None for notifications."""
+        try:
+            request = json.loads(line)
+        except ValueError as e:
+            return {"jsonrpc": "2.0", "id": None,
+                    "error": {"code": -32700, "message": f"Parse error: {e}"}}
+        if not isinstance(request, dict) or not isinstance(request.get("method"), str):
+            return {"jsonrpc": "2.0", "id": None,
+                    "error": {"code": -32600, "message": "Invalid request"}}
+        method, params = request["method"], request.get("params") or {}
+        try:
+            if not isinstance(params, dict):
+                raise TypeError("params must be an object")
+            if method == "start":
+                result = await self.start(str(params["student"]))
+            elif method == "answer":
+                result = await self.answer(str(params["student"]), str(params["item"]),
+                                           bool(params["correct"]))
+            elif method == "finish":
+                result = await self.finish(str(params["student"]))
+            elif method == "flush":
+                result = await self.flush()
+            elif method == "status":
+                result = self.status()
+            elif method == "shutdown":
+                self.stopped.set()
+                result = self.status()
+            else:
+                error = {"code": -32601, "message": f"Unknown method: {method}"}
+                return {"jsonrpc": "2.0", "id": request.get("id"), "error": error}
+        except (KeyError, TypeError) as e:
+            error = {"code": -32602, "message": f"Invalid params: {e}"}
+        except SessionError as e:
+            error = {"code": -32000, "message": str(e)}
+        else:
+            if "id" not in request:
+                return None
+            return {"jsonrpc": "2.0", "id": request["id"], "result": result}
+        return {"jsonrpc": "2.0", "id": request.get("id"), "error": error}
+
+
+_WRITER_GRAPH: tuple[str, dict, tuple[int, int]] | None = None
+
+
+def _file_stamp(path: str) -> tuple[int, int]:
+    st = os.stat(path)
+    return st.st_mtime_ns, st.st_size
+
+
+def _writer_init(graph_path: str) -> None:
+    global _WRITER_GRAPH
+    _WRITER_GRAPH = (graph_path, load_graph(graph_path), _file_stamp(graph_path))
+
+
+def _writer_save(pending: dict[str, dict[str, Any]]) -> None:
+    """
+    Merge pending student records into the writer's graph and save it.
+
+    The graph is reloaded first if the file changed since this process last
+    read or wrote it (e.g. a kst_utils.py command ran meanwhile), so edits
+    made by other tools are merged into rather than overwritten.
+    """
+    global _WRITER_GRAPH
+    path, graph, stamp = _WRITER_GRAPH
+    if _file_stamp(path) != stamp:
+        graph = load_graph(path)
+    students = graph.setdefault("student_states", {})
+    for sid, update in pending.items():
+        record = students.setdefault(sid, {"current_state": []})
+        record.setdefault("assessment_log", []).extend(update["log"])
+        if "state" in update:
+            record["current_state"] = update["state"]
+            record.setdefault("history", []).append(update["history"])
+    save_graph(graph, path, quiet=True)
+    _WRITER_GRAPH = (path, graph, _file_stamp(path))
+
+
+async def serve(service: AssessmentService, socket_path: str | None = None,
+                port: int = 8765) -> None:
+    """Serve JSON-RPC on a Unix socket (or localhost:port) until shutdown."""
+
+    async def respond(line: str, writer: asyncio.StreamWriter) -> None:
+        response = await service.handle(line)
+        if response is not None:
+            writer.write((json.dumps(response) + "\n").encode("utf-8"))
+            await writer.drain()
+
+    connections: dict[asyncio.Task, asyncio.StreamWriter] = {}
+
+    async def connection(reader: asyncio.StreamReader,
+                         writer: asyncio.StreamWriter) -> None:
+        connections[asyncio.current_task()] = writer
+        tasks = set()
+        try:
+            while line := await reader.readline():
+                if line.strip():
+                    task = asyncio.ensure_future(respond(line.decode("utf-8"), writer))
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+        except asyncio.CancelledError:
+            pass  # shutdown; asyncio < 3.12 logs handlers that end cancelled
+        finally:
+            for task in tasks:
+                task.cancel()
+            writer.close()
+            connections.pop(asyncio.current_task(), None)
+
+    if socket_path:
+        remove_stale_socket(socket_path)
+        server = await asyncio.start_unix_server(connection, socket_path, backlog=1024)
+        where = socket_path
+    else:
+        server = await asyncio.start_server(connection, "127.0.0.1", port, backlog=1024)
+        where = f"127.0.0.1:{port}"
+    flusher = asyncio.ensure_future(service.run_flusher())
+    print(f"Assessing {len(service.model)} states x {len(service.model.item_ids)} "
+          f"items; serving on {where}", file=sys.stderr)
+    try:
+        async with server:
+            await service.stopped.wait()
+            # wait_closed() waits for open connections, so end them first;
+            # each handler closes its writer as it unwinds.
+            server.close()
+            for task in connections:
+                task.cancel()
+            await asyncio.gather(*connections, return_exceptions=True)
+    finally:
+        flusher.cancel()
+        await service.close()
+        if socket_path and os.path.exists(socket_path):
+            os.remove(socket_path)
+
+
+# ---------------------------------------------------------------------------
+# CLI Interface
+# ---------------------------------------------------------------------------
+
+def main():
+    if len(sys.argv) < 2 or sys.argv[1] in ("-h", "--help"):
+        print(__doc__.strip())
+        sys.exit(1)
+
+    def option(flag: str, cast, default):
+        if flag in sys.argv:
+            return cast(sys.argv[sys.argv.index(flag) + 1])
+        return default
+
+    socket_path = option("--socket", str, None)
+    if socket_path:
+        try:
+            remove_stale_socket(socket_path)
+        except ValueError as e:
+            print(f"Error: {e}", file=sys.stderr)
+            sys.exit(1)
+
+    service = AssessmentService(
+        sys.argv[1],
+        min_entropy=option("--min-entropy", float, 1.0),
+        max_items=option("--max-items", int, None),
+        flush_interval=option("--flush-interval", float, 2.0),
+        batch_window=option("--batch-window", float, 0.002),
+    )
+    started = time.perf_counter()
+    try:
+        asyncio.run(serve(service, socket_path, option("--port", int, 8765)))
+    except KeyboardInterrupt:
+        pass
+    print(f"Stopped after {time.perf_counter() - started:.0f}s: "
+          f"{json.dumps(service.status())}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
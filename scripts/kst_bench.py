@@ -0,0 +1,505 @@
+"""
+KST Benchmarks — Scaling Measurements for kst_utils
+
+Times the public functions of scripts/kst_utils.py over size sweeps of
+seeded synthetic graphs and writes a machine-readable report:
+- Generators: layered curricula, chains, wide antichains, random DAGs
+  with a given density, student populations and BLIM response logs
+- Wall time (best and median of N repeats) and peak traced memory
+- Result sizes, so capped enumerations are visible in the report
+- Comparison against an earlier report to flag scaling regressions
+
+Usage:
+    python3 scripts/kst_bench.py [--quick | --sizes N,...] [--only NAME,...]
+        [--generators NAME,...] [--repeat N]
+        [--budget SECONDS] [--trace-limit SECONDS] [--output report.json]
+        [--compare baseline.json] [--threshold 1.25]
+
+Every graph is generated from a fixed seed, so two reports taken on the
+same machine differ only by the code under test.
+"""
+
+import io
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+import tracemalloc
+from contextlib import redirect_stderr
+from datetime import datetime, timezone
+from statistics import median
+from typing import Any, Callable
+
+from kst_utils import (
+    BlimModel,
+    SurmiseIndex,
+    blim_update,
+    class_analytics,
+    compute_fringes,
+    count_states,
+    enumerate_downsets,
+    fit_blim,
+    generate_learning_paths,
+    iter_downsets,
+    np,
+    sample_states,
+    transitive_closure,
+    validate_graph,
+)
+
+REPORT_VERSION = 1
+BLOOM_LEVELS = ["remember", "understand", "apply", "analyze", "evaluate", "create"]
+
+
+# ---------------------------------------------------------------------------
+# Synthetic Generators
+# ---------------------------------------------------------------------------
+
+def _item(k: int, rng: random.Random, level: int = 0, topic: str = "") -> dict:
+    return {
+        "id": f"item-{k:04d}",
+        "label": f"Item {k}",
+        "description": f"Synthetic item {k}",
+        "bloom_level": BLOOM_LEVELS[min(level, len(BLOOM_LEVELS) - 1)],
+        "dok_level": rng.randint(1, 4),
+        "tags": [topic or f"topic-{rng.randrange(8)}"],
+    }
+
+
+def _graph(name: str, items: list[dict], pairs: list[tuple[int, int]]) -> dict:
+    return {
+        "metadata": {
+            "domain_name": name,
+            "version": "1.0.0",
+            "created_at": "2000-01-01T00:00:00Z",
+        },
+        "items": items,
+        "surmise_relations": [
+            {"prerequisite": items[a]["id"], "target": items[b]["id"]}
+            for a, b in pairs
+        ],
+    }
+
+
+def chain_graph(n: int, seed: int = 0) -> dict:
+    """A single prerequisite chain: n + 1 states."""
+    rng = random.Random(seed)
+    items = [_item(k, rng, k * len(BLOOM_LEVELS) // max(n, 1)) for k in range(n)]
+    return _graph(f"chain-{n}", items, [(k, k + 1) for k in range(n - 1)])
+
+
+def antichain_graph(n: int, seed: int = 0) -> dict:
+    """n unrelated items: every subset is a state (2^n states)."""
+    rng = random.Random(seed)
+    return _graph(f"antichain-{n}", [_item(k, rng) for k in range(n)], [])
+
+
+def layered_graph(n: int, width: int = 8, fan_in: int = 2, seed: int = 0) -> dict:
+    """
+    A curriculum of n items in layers of `width`, one topic per column.
+    Each item past the first layer has 1..fan_in prerequisites in the
+    layer below, preferring its own column.
+    """
+    rng = random.Random(seed)
+    n_layers = max(1, -(-n // width))
+    items, pairs = [], []
+    for k in range(n):
+        layer, col = divmod(k, width)
+        items.append(_item(k, rng, layer * len(BLOOM_LEVELS) // n_layers,
+                           f"topic-{col}"))
+        if layer:
+            below = list(range((layer - 1) * width, layer * width))
+            same = (layer - 1) * width + col
+            chosen = {same} | set(rng.sample(below, rng.randint(1, fan_in) - 1))
+            pairs.extend((a, k) for a in sorted(chosen))
+    return _graph(f"layered-{n}", items, pairs)
+
+
+def random_dag(n: int, density: float = 0.05, seed: int = 0) -> dict:
+    """Each forward pair (a < b) is a relation with probability `density`."""
+    rng = random.Random(seed)
+    items = [_item(k, rng) for k in range(n)]
+    pairs = [(a, b) for a in range(n) for b in range(a + 1, n)
+             if rng.random() < density]
+    return _graph(f"dag-{n}-{density}", items, pairs)
+
+
+GENERATORS: dict[str, Callable[[int, int], dict]] = {
+    "chain": lambda n, seed: chain_graph(n, seed),
+    "antichain": lambda n, seed: antichain_graph(n, seed),
+    "layered": lambda n, seed: layered_graph(n, seed=seed),
+    "dag": lambda n, seed: random_dag(n, 0.05, seed),
+}
+
+
+def add_students(
+    graph: dict,
+    n_students: int,
+    log_length: int = 10,
+    lucky_guess: float = 0.1,
+    careless_error: float = 0.1,
+    seed: int = 0,
+    index: SurmiseIndex | None = None
+) -> dict:
+    """
+    Populate graph["student_states"] in place with n_students whose true
+    states are drawn uniformly from the space, and response logs of
+    log_length items answered according to the BLIM with the given rates.
+    """
+    rng = random.Random(seed)
+    item_ids = [item["id"] for item in graph["items"]]
+    states = sample_states(graph, n_students, seed, index)
+    students = {}
+    for k, state in enumerate(states):
+        log = []
+        for iid in rng.sample(item_ids, min(log_length, len(item_ids))):
+            if iid in state:
+                correct = rng.random() >= careless_error
+            else:
+                correct = rng.random() < lucky_guess
+            log.append({
+                "timestamp": "2000-01-01T00:00:00Z",
+                "item_id": iid,
+                "response": "correct" if correct else "incorrect",
+            })
+        students[f"student-{k:05d}"] = {
+            "current_state": sorted(state),
+            "assessment_log": log,
+        }
+    graph["student_states"] = students
+    return graph
+
+
+# ---------------------------------------------------------------------------
+# Benchmarks
+# ---------------------------------------------------------------------------
+
+# Caps keep antichains and dense sweeps bounded; results record the size
+# actually produced.
+MAX_STATES = 5000
+FIT_MAX_STATES = 500
+N_STUDENTS = 200
+N_RESPONSES = 20
+
+
+def _states(graph: dict, cap: int = MAX_STATES) -> list[frozenset[str]]:
+    # enumerate_downsets warns when it hits the cap; the cap is expected
+    # here and the result size is reported instead.
+    with redirect_stderr(io.StringIO()):
+        return enumerate_downsets(graph, cap)
+
+
+def _bench_fringes(graph: dict) -> Callable[[], int]:
+    states = _states(graph)
+    family = set(states)
+    item_ids = {item["id"] for item in graph["items"]}
+    return lambda: sum(len(compute_fringes(s, family, item_ids)[1]) for s in states)
+
+
+def _bench_blim_update(graph: dict) -> Callable[[], int]:
+    states = {f"s{k}": set(s) for k, s in enumerate(_states(graph))}
+    log = _responses(graph)
+
+    def run() -> int:
+        probs = {sid: 1 / len(states) for sid in states}
+        for iid, correct in log:
+            probs = blim_update(probs, states, iid, correct)
+        return len(probs)
+    return run
+
+
+def _bench_blim_model(graph: dict) -> Callable[[], int]:
+    index = SurmiseIndex.from_graph(graph)
+    masks = [index.mask(s) for s in _states(graph)]
+    log = _responses(graph)
+
+    def run() -> int:
+        model = BlimModel(index.item_ids, masks, None, 0.1, 0.1)
+        for iid, correct in log:
+            model.update(iid, correct)
+        return len(model)
+    return run
+
+
+def _responses(graph: dict) -> list[tuple[str, bool]]:
+    rng = random.Random(len(graph["items"]))
+    return [(item["id"], rng.random() < 0.5)
+            for item in rng.choices(graph["items"], k=N_RESPONSES)]
+
+
+def _with_students(graph: dict) -> dict:
+    """A copy of graph with generated students; graph itself is left as is."""
+    graph = dict(graph)
+    if "student_states" not in graph:
+        add_students(graph, N_STUDENTS, seed=len(graph["items"]))
+    return graph
+
+
+def _bench_fit_blim(graph: dict) -> Callable[[], int]:
+    # fit_blim runs over stored states when present; store a capped
+    # enumeration so antichains do not enumerate 2^n states.
+    graph = _with_students(graph)
+    graph["knowledge_states"] = [
+        {"id": f"s{k}", "items": sorted(s)} for k, s in enumerate(_states(graph, FIT_MAX_STATES))]
+    return lambda: fit_blim(graph, max_iter=5, apply=False)["iterations"]
+
+
+def _capped_iter(graph: dict) -> int:
+    count = 0
+    for _ in iter_downsets(graph):
+        count += 1
+        if count >= MAX_STATES:
+            break
+    return count
+
+
+# name -> setup(graph) returning a zero-argument callable whose result is
+# an int (reported as result_size). Setup work is not timed.
+BENCHMARKS: dict[str, Callable[[dict], Callable[[], int]]] = {
+    "SurmiseIndex.from_graph": lambda g: lambda: len(SurmiseIndex.from_graph(g)),
+    "transitive_closure": lambda g: lambda: len(transitive_closure(g)),
+    "count_states": lambda g: lambda: count_states(g).bit_length(),
+    "iter_downsets": lambda g: lambda: _capped_iter(g),
+    "enumerate_downsets": lambda g: lambda: len(_states(g)),
+    "compute_fringes": _bench_fringes,
+    "generate_learning_paths": lambda g: lambda: len(generate_learning_paths(g, max_paths=5)),
+    "validate_graph": lambda g: lambda: len(validate_graph(g)["fail"]),
+    "blim_update": _bench_blim_update,
+    "BlimModel.update": _bench_blim_model,
+    "class_analytics": lambda g: (lambda s: lambda: len(class_analytics(s)["clusters"]))(
+        _with_students(g)),
+    "fit_blim": _bench_fit_blim,
+}
+
+QUICK_SIZES = [16, 32, 64]
+FULL_SIZES = [16, 32, 64, 128, 256]
+
+
+def measure(fn: Callable[[], int], repeat: int,
+            trace_limit: float = 1.0) -> dict[str, Any]:
+    """
+    Time fn `repeat` times, then once more under tracemalloc for peak
+    memory. Tracing slows allocation-heavy code by an order of magnitude or
+    more, so it is skipped when the best untraced run took longer than
+    trace_limit seconds: peak_bytes is then None and "memory" says why.
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - start)
+    peak, memory = None, "not measured: over trace limit"
+    if min(times) <= trace_limit:
+        tracemalloc.start()
+        try:
+            fn()
+            peak, memory = tracemalloc.get_traced_memory()[1], "traced"
+        finally:
+            tracemalloc.stop()
+    return {
+        "seconds": times,
+        "best": min(times),
+        "median": median(times),
+        "peak_bytes": peak,
+        "memory": memory,
+        "result_size": result,
+    }
+
+
+def run_suite(
+    sizes: list[int],
+    names: list[str] | None = None,
+    generators: list[str] | None = None,
+    repeat: int = 3,
+    budget: float = 10.0,
+    trace_limit: float = 1.0,
+    seed: int = 0,
+    log: Callable[[str], None] | None = None
+) -> list[dict[str, Any]]:
+    """
+    Run every benchmark over every generator and size.
+
+    A (benchmark, generator) sweep stops at the first size whose best time
+    exceeds `budget` seconds; the skipped sizes are recorded as such so
+    reports stay comparable.
+    """
+    names = names or list(BENCHMARKS)
+    generators = generators or list(GENERATORS)
+    graphs = {(gen, n): GENERATORS[gen](n, seed) for gen in generators for n in sizes}
+    results = []
+    for name in names:
+        setup = BENCHMARKS[name]
+        for gen in generators:
+            over_budget = False
+            for n in sizes:
+                graph = graphs[(gen, n)]
+                row = {"benchmark": name, "generator": gen, "size": n,
+                       "relations": len(graph["surmise_relations"])}
+                if over_budget:
+                    row["skipped"] = "budget"
+                else:
+                    row.update(measure(setup(graph), repeat, trace_limit))
+                    over_budget = row["best"] > budget
+                    if log:
+                        peak = row["peak_bytes"]
+                        memory = f"{peak / 1e6:8.2f} MB" if peak is not None else "       - MB"
+                        log(f"{name:<24} {gen:<10} {n:>5}  {row['best']:9.4f}s  "
+                            f"{memory}  -> {row['result_size']}")
+                results.append(row)
+    return results
+
+
+def environment() -> dict[str, Any]:
+    """Interpreter, platform and source revision, recorded with each report."""
+    try:
+        revision = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        revision = None
+    return {
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "numpy": np.__version__ if np is not None else None,
+        "revision": revision,
+    }
+
+
+def compare_reports(
+    current: dict,
+    baseline: dict,
+    threshold: float = 1.25
+) -> list[dict[str, Any]]:
+    """
+    Match rows on (benchmark, generator, size) and return those whose best
+    time ("metric": "time") or peak memory ("metric": "peak_bytes") grew by
+    more than `threshold` times over the baseline. Memory is compared only
+    where both reports traced it; time regressions on rows where either did
+    not carry "memory": "not measured".
+    """
+    def key(row: dict) -> tuple:
+        return row["benchmark"], row["generator"], row["size"]
+
+    before = {key(row): row for row in baseline["results"] if "best" in row}
+    regressions = []
+    for row in current["results"]:
+        old = before.get(key(row))
+        if old is None or "best" not in row or old["best"] <= 0:
+            continue
+        traced = (row.get("peak_bytes") is not None
+                  and old.get("peak_bytes") is not None)
+        ratio = row["best"] / old["best"]
+        if ratio > threshold:
+            regressions.append({
+                "benchmark": row["benchmark"], "generator": row["generator"],
+                "size": row["size"], "metric": "time", "before": old["best"],
+                "after": row["best"], "ratio": round(ratio, 3),
+                "memory": "traced" if traced else "not measured",
+            })
+        if traced and old["peak_bytes"] > 0:
+            ratio = row["peak_bytes"] / old["peak_bytes"]
+            if ratio > threshold:
+                regressions.append({
+                    "benchmark": row["benchmark"], "generator": row["generator"],
+                    "size": row["size"], "metric": "peak_bytes",
+                    "before": old["peak_bytes"], "after": row["peak_bytes"],
+                    "ratio": round(ratio, 3),
+                })
+    return regressions
+
+
+# ---------------------------------------------------------------------------
+# CLI Interface
+# ---------------------------------------------------------------------------
+
+def _usage(file=None) -> None:
+    print(__doc__.strip(), file=file)
+    print("\nBenchmarks:", ", ".join(BENCHMARKS), file=file)
+    print("Generators:", ", ".join(GENERATORS), file=file)
+
+
+def _usage_error(message: str) -> None:
+    print(message, file=sys.stderr)
+    print(file=sys.stderr)
+    _usage(sys.stderr)
+    sys.exit(1)
+
+
+def main():
+    if "--help" in sys.argv or "-h" in sys.argv:
+        _usage()
+        sys.exit(0)
+
+    sizes = QUICK_SIZES if "--quick" in sys.argv else FULL_SIZES
+    if "--sizes" in sys.argv:
+        sizes = [int(n) for n in sys.argv[sys.argv.index("--sizes") + 1].split(",")]
+    names = None
+    if "--only" in sys.argv:
+        names = sys.argv[sys.argv.index("--only") + 1].split(",")
+        unknown = [name for name in names if name not in BENCHMARKS]
+        if unknown:
+            _usage_error(f"Unknown benchmark(s): {', '.join(unknown)}")
+    generators = None
+    if "--generators" in sys.argv:
+        generators = sys.argv[sys.argv.index("--generators") + 1].split(",")
+        unknown = [gen for gen in generators if gen not in GENERATORS]
+        if unknown:
+            _usage_error(f"Unknown generator(s): {', '.join(unknown)}")
+    repeat = 3
+    if "--repeat" in sys.argv:
+        repeat = int(sys.argv[sys.argv.index("--repeat") + 1])
+    budget = 10.0
+    if "--budget" in sys.argv:
+        budget = float(sys.argv[sys.argv.index("--budget") + 1])
+    trace_limit = 1.0
+    if "--trace-limit" in sys.argv:
+        trace_limit = float(sys.argv[sys.argv.index("--trace-limit") + 1])
+    output = "kst_bench.json"
+    if "--output" in sys.argv:
+        output = sys.argv[sys.argv.index("--output") + 1]
+
+    results = run_suite(sizes, names, generators, repeat, budget, trace_limit,
+                        log=lambda line: print(line, flush=True))
+    report = {
+        "version": REPORT_VERSION,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "environment": environment(),
+        "config": {"sizes": sizes, "repeat": repeat, "budget": budget,
+                   "trace_limit": trace_limit, "max_states": MAX_STATES,
+                   "fit_max_states": FIT_MAX_STATES, "n_students": N_STUDENTS,
+                   "n_responses": N_RESPONSES},
+        "results": results,
+    }
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nReport written to {output}")
+
+    if "--compare" in sys.argv:
+        with open(sys.argv[sys.argv.index("--compare") + 1]) as f:
+            baseline = json.load(f)
+        threshold = 1.25
+        if "--threshold" in sys.argv:
+            threshold = float(sys.argv[sys.argv.index("--threshold") + 1])
+        regressions = compare_reports(report, baseline, threshold)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) over {threshold}x:")
+            for r in regressions:
+                if r["metric"] == "time":
+                    change = f"{r['before']:.4f}s -> {r['after']:.4f}s"
+                    if r["memory"] != "traced":
+                        change += ", memory not measured"
+                else:
+                    change = f"{r['before'] / 1e6:.2f} MB -> {r['after'] / 1e6:.2f} MB"
+                print(f"  {r['benchmark']} [{r['generator']}, n={r['size']}]: "
+                      f"{change} ({r['ratio']}x)")
+            sys.exit(1)
+        print(f"\nNo regressions over {threshold}x.")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,28 +2,150 @@
 KST Utility Functions — Knowledge Space Theory Computations
 
 Provides computational functions for the KST skill pipeline:
-- Graph loading/saving with schema awareness
-- Transitive closure of surmise relations
+- Graph loading/saving with schema awareness, streaming reads of large files
+- Transitive closure and reduction of surmise relations
 - Downset (knowledge state) enumeration
 - Fringe computation (inner and outer)
+- Base and atoms of a knowledge space
+- Item states derived from competences (CbKST)
 - Learning path generation
 - BLIM Bayesian state updating for adaptive assessment
 - Validation checks
 - Class-wide analytics
+- Phase profiling (--profile) with Chrome-trace output
 
 Usage from skills:
     Read and adapt the code in scripts/kst_utils.py. Run with:
     python3 scripts/kst_utils.py <command> <graph-path> [options]
 
 Dependencies: Python 3.9+ standard library only (json, itertools, collections).
+NumPy is used by BlimModel when installed, with an array-module fallback.
 """
 
+import hashlib
+import heapq
+import io
 import json
+import math
+import mmap
+import os
+import random
+import re
+import shlex
+import socketserver
+import stat
+import struct
 import sys
-from collections import defaultdict
-from itertools import combinations
+import threading
+import time
+from array import array
+from collections import Counter, OrderedDict, defaultdict
+from collections.abc import Sequence
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, as_completed, wait
+from contextlib import contextmanager, nullcontext, redirect_stderr, redirect_stdout
+from itertools import compress, islice
+from operator import add, mul
 from datetime import datetime, timezone
-from typing import Any
+from typing import Any, Callable, Iterable, Iterator
+
+try:
+    import numpy as np
+except ImportError:  # optional; BlimModel falls back to the array module
+    np = None
+
+
+# ---------------------------------------------------------------------------
+# Profiling
+# ---------------------------------------------------------------------------
+
+class Profiler:
+    """
+    Records wall time and sizes of the phases of a run.
+
+    Instrumented functions open phases with profile_phase(name) and attach
+    sizes (states visited, relations scanned, pairs checked, ...) with
+    profile_count(name, n), which adds to the innermost open phase. Each
+    finished phase becomes a Chrome trace "complete" event with its
+    counters as args (load the written file in chrome://tracing or
+    Perfetto) and is passed to every hook as (name, seconds, counters).
+
+    Install one with set_profiler. When none is installed, instrumentation
+    points cost a global lookup each and are placed outside inner loops.
+    A Profiler is not thread-safe; process-pool workers are not traced.
+    """
+
+    def __init__(self, hooks: Iterable[Callable[[str, float, dict], None]] = ()):
+        self.hooks = list(hooks)
+        self.events: list[dict] = []
+        self.counters: dict[str, int] = {}  # counts made outside any phase
+        self._stack: list[dict[str, int]] = []
+        self._origin = time.perf_counter()
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        counters: dict[str, int] = {}
+        self._stack.append(counters)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            self._stack.pop()
+            self.events.append({
+                "name": name, "ph": "X", "pid": os.getpid(), "tid": 0,
+                "ts": round((start - self._origin) * 1e6, 3),
+                "dur": round(seconds * 1e6, 3), "args": counters,
+            })
+            for hook in self.hooks:
+                hook(name, seconds, counters)
+
+    def count(self, name: str, n: int = 1) -> None:
+        counters = self._stack[-1] if self._stack else self.counters
+        counters[name] = counters.get(name, 0) + n
+
+    def summary(self) -> dict[str, dict[str, Any]]:
+        """Per phase name: number of calls, total seconds and summed counters."""
+        phases: dict[str, dict[str, Any]] = {}
+        for event in self.events:
+            entry = phases.setdefault(event["name"], {"calls": 0, "seconds": 0.0})
+            entry["calls"] += 1
+            entry["seconds"] += event["dur"] / 1e6
+            for key, n in event["args"].items():
+                entry[key] = entry.get(key, 0) + n
+        return phases
+
+    def chrome_trace(self, **metadata: Any) -> dict:
+        """The trace in Chrome's JSON object format, with summary and metadata."""
+        return {
+            "traceEvents": sorted(self.events, key=lambda e: e["ts"]),
+            "displayTimeUnit": "ms",
+            "otherData": dict(metadata, summary=self.summary(),
+                              counters=self.counters),
+        }
+
+
+_PROFILER: Profiler | None = None
+_NO_PHASE = nullcontext()
+
+
+def set_profiler(profiler: Profiler | None) -> Profiler | None:
+    """Install a profiler (None to disable) and return the previous one."""
+    global _PROFILER
+    previous, _PROFILER = _PROFILER, profiler
+    return previous
+
+
+def profile_phase(name: str):
+    """Context manager timing a phase on the installed profiler, if any."""
+    profiler = _PROFILER
+    return _NO_PHASE if profiler is None else profiler.phase(name)
+
+
+def profile_count(name: str, n: int = 1) -> None:
+    """Add n to a counter of the current phase on the installed profiler, if any."""
+    profiler = _PROFILER
+    if profiler is not None:
+        profiler.count(name, n)
 
 
 # ---------------------------------------------------------------------------
@@ -31,27 +153,788 @@ from typing import Any
 # ---------------------------------------------------------------------------
 
 def load_graph(path: str) -> dict:
-    """Load a knowledge graph JSON file."""
-    with open(path) as f:
-        return json.load(f)
+    """
+    Load a knowledge graph JSON file.
+
+    If metadata.state_table names a binary sidecar (see save_graph) and the
+    JSON has no knowledge_states, the sidecar is memory-mapped and exposed
+    as graph["knowledge_states"] (a StateTable), without being parsed.
+    """
+    with profile_phase("load_graph"), open(path) as f:
+        graph = json.load(f)
+        profile_count("bytes", f.tell())
+    return _attach_state_table(graph, path)
+
+
+def _attach_state_table(graph: dict, path: str) -> dict:
+    table = graph.get("metadata", {}).get("state_table")
+    if table and "knowledge_states" not in graph:
+        graph["knowledge_states"] = StateTable(
+            os.path.join(os.path.dirname(path), table))
+    return graph
+
+
+def save_graph(graph: dict, path: str, binary: bool | None = None,
+               quiet: bool = False) -> None:
+    """
+    Save a knowledge graph JSON file with pretty formatting.
+
+    With binary=True, knowledge_states are written to a sidecar next to
+    the JSON (see write_state_table) and left out of the JSON, whose
+    metadata.state_table names the sidecar. The JSON stays canonical for
+    everything else. binary defaults to true for graphs that already use a
+    sidecar; a sidecar that knowledge_states is still mapped from (so the
+    states are unchanged) is not rewritten.
+    quiet suppresses the confirmation line on stdout.
+    """
+    ks = graph.get("knowledge_states")
+    if binary is None:
+        binary = isinstance(ks, StateTable) or bool(
+            graph["metadata"].get("state_table"))
+    doc = graph
+    if binary and ks is not None:
+        table = os.path.splitext(os.path.basename(path))[0] + ".kstb"
+        target = os.path.join(os.path.dirname(path), table)
+        if not (isinstance(ks, StateTable) and ks.maps(target)):
+            write_state_table(graph, target)
+        graph["metadata"]["state_table"] = table
+        doc = {k: v for k, v in graph.items() if k != "knowledge_states"}
+    else:
+        graph["metadata"].pop("state_table", None)
+        if isinstance(ks, StateTable):
+            doc = dict(graph, knowledge_states=list(ks))
+    tmp = path + ".tmp"
+    with profile_phase("save_graph"):
+        with open(tmp, "w") as f:
+            json.dump(doc, f, indent=2, ensure_ascii=False)
+            profile_count("bytes", f.tell())
+        os.replace(tmp, path)  # readers never see a half-written graph
+    if not quiet:
+        print(f"Saved graph to {path}")
+
+
+_JSON_SPECIAL = re.compile(r'["\[\]{},]')
+_JSON_NESTED = re.compile(r'["\[\]{}]')  # commas only matter at depth 1
+_JSON_STRING_TAIL = re.compile(r'[^"\\]*(?:\\.[^"\\]*)*"', re.S)
+_JSON_SCALAR = re.compile(r'[^\s,\]}]+')
+
+
+class GraphStream:
+    """
+    Incremental reader for large knowledge graph JSON files.
+
+    The file is read in chunks of chunk_size characters. Top-level sections
+    that are not requested are skipped by a scanner that only tracks
+    strings and bracket depth, discarding text as it goes, so their size
+    does not matter; requested sections, and one student record at a time,
+    are handed to json.loads. Every pass also records the number of
+    entries of each top-level section in self.counts.
+
+        stream = GraphStream(path)
+        graph = stream.sections(["metadata", "items", "surmise_relations"])
+        for sid, record in stream.students(["current_state", "outer_fringe"]):
+            ...
+    """
+
+    def __init__(self, path: str, chunk_size: int = 1 << 16):
+        self.path = path
+        self.chunk_size = chunk_size
+        self.counts: dict[str, int] = {}
+
+    def sections(self, keys: Iterable[str]) -> dict:
+        """Materialize the listed top-level sections in one pass."""
+        return dict(self._scan(set(keys), None, False))
+
+    def students(self, fields: Iterable[str] | None = None
+                 ) -> Iterator[tuple[str, dict]]:
+        """
+        Yield (student_id, record) for every entry of student_states, with
+        only the listed fields parsed (all fields if None).
+        """
+        wanted = set(fields) if fields is not None else None
+        for _, student in self._scan(set(), wanted, True):
+            yield student
+
+    def _scan(self, keys: set[str], student_fields: set[str] | None,
+              students: bool) -> Iterator[tuple[str, Any]]:
+        with open(self.path, encoding="utf-8") as self._file:
+            self._buf, self._pos, self._mark = "", 0, None
+            self._expect("{")
+            while self._peek() != "}":
+                key = self._string()
+                self._expect(":")
+                if key == "student_states" and students:
+                    n = 0
+                    self._expect("{")
+                    while self._peek() != "}":
+                        sid = self._string()
+                        self._expect(":")
+                        yield key, (sid, self._object(student_fields))
+                        n += 1
+                        self._comma()
+                    self._pos += 1
+                    self.counts[key] = n
+                elif key in keys:
+                    n, text = self._value(keep=True)
+                    self.counts[key] = n
+                    yield key, json.loads(text)
+                else:
+                    self.counts[key] = self._value(keep=False)[0]
+                self._comma()
+
+    def _more(self) -> None:
+        """Read the next chunk, dropping text before the cursor or mark."""
+        chunk = self._file.read(self.chunk_size)
+        if not chunk:
+            raise ValueError(f"Unexpected end of graph JSON: {self.path}")
+        keep = self._pos if self._mark is None else self._mark
+        self._buf = self._buf[keep:] + chunk
+        self._pos -= keep
+        if self._mark is not None:
+            self._mark -= keep
+
+    def _peek(self) -> str:
+        """Skip whitespace and return the next character."""
+        while True:
+            buf, pos = self._buf, self._pos
+            while pos < len(buf) and buf[pos] in " \t\r\n":
+                pos += 1
+            self._pos = pos
+            if pos < len(buf):
+                return buf[pos]
+            self._more()
+
+    def _expect(self, ch: str) -> None:
+        if self._peek() != ch:
+            raise ValueError(f"Malformed graph JSON: expected {ch!r} in {self.path}")
+        self._pos += 1
+
+    def _comma(self) -> None:
+        if self._peek() == ",":
+            self._pos += 1
+
+    def _string(self) -> str:
+        if self._peek() != '"':
+            raise ValueError(f"Malformed graph JSON: expected a key in {self.path}")
+        return json.loads(self._value(keep=True)[1])
+
+    def _object(self, fields: set[str] | None) -> dict:
+        """Parse an object, materializing only the listed members."""
+        if fields is None:
+            return json.loads(self._value(keep=True)[1])
+        record = {}
+        self._expect("{")
+        while self._peek() != "}":
+            key = self._string()
+            self._expect(":")
+            if key in fields:
+                record[key] = json.loads(self._value(keep=True)[1])
+            else:
+                self._value(keep=False)
+            self._comma()
+        self._pos += 1
+        return record
+
+    def _value(self, keep: bool) -> tuple[int, str | None]:
+        """
+        Consume the JSON value at the cursor. Returns (number of entries if
+        it is an array or object, else 0; its text if keep, else None).
+        """
+        self._peek()
+        self._mark = self._pos if keep else None
+        try:
+            entries = self._skip_value()
+            return entries, self._buf[self._mark:self._pos] if keep else None
+        finally:
+            self._mark = None
+
+    def _skip_value(self) -> int:
+        ch = self._buf[self._pos]
+        if ch == '"':
+            self._skip_string()
+            return 0
+        if ch not in "[{":
+            while True:
+                m = _JSON_SCALAR.match(self._buf, self._pos)
+                if m.end() < len(self._buf):
+                    self._pos = m.end()
+                    return 0
+                self._more()
+        self._pos += 1
+        entries = 0 if self._peek() in "]}" else 1
+        depth = 1
+        while True:
+            pattern = _JSON_SPECIAL if depth == 1 else _JSON_NESTED
+            m = pattern.search(self._buf, self._pos)
+            if m is None:
+                self._pos = len(self._buf)
+                self._more()
+                continue
+            ch = m.group()
+            self._pos = m.end()
+            if ch == '"':
+                self._pos -= 1
+                self._skip_string()
+            elif ch in "[{":
+                depth += 1
+            elif ch in "]}":
+                depth -= 1
+                if depth == 0:
+                    return entries
+            elif depth == 1:
+                entries += 1
+
+    def _skip_string(self) -> None:
+        while True:
+            m = _JSON_STRING_TAIL.match(self._buf, self._pos + 1)
+            if m is not None:
+                self._pos = m.end()
+                return
+            self._more()
+
+
+# ---------------------------------------------------------------------------
+# Binary State Tables
+# ---------------------------------------------------------------------------
+
+_TABLE_MAGIC = b"KSTB\x01\x00\x00\x00"
+_TABLE_HEADER = struct.Struct("<8s3Q7Q")  # magic, counts, section offsets
+
+
+def write_state_table(graph: dict, path: str) -> None:
+    """
+    Write graph["knowledge_states"] to a binary state table.
+
+    Layout (little-endian, sections 8-byte aligned): a header with the item
+    and state counts, the row width and the section offsets; the item IDs
+    and state IDs, each stored once as a string table; states, inner
+    fringes and outer fringes as fixed-width bitmask rows over the items;
+    and prior probabilities as float64 (when every state has one). Student
+    records stay in the JSON, which is canonical for them.
+    """
+    item_ids = [item["id"] for item in graph["items"]]
+    position = {iid: i for i, iid in enumerate(item_ids)}
+    width = max((len(item_ids) + 7) // 8, 1)
+    ks = graph.get("knowledge_states", [])
+
+    def mask(ids: Iterable[str]) -> int:
+        m = 0
+        for iid in ids:
+            i = position.get(iid)
+            if i is not None:
+                m |= 1 << i
+        return m
+
+    if isinstance(ks, StateTable):
+        states, inner, outer = (ks.masks(item_ids, table)
+                                for table in ("states", "inner", "outer"))
+        state_ids, prior = ks.state_ids(), ks.prior
+    else:
+        states = [mask(s["items"]) for s in ks]
+        inner = [mask(s.get("inner_fringe", [])) for s in ks]
+        outer = [mask(s.get("outer_fringe", [])) for s in ks]
+        state_ids = [s["id"] for s in ks]
+        prior = ([s["prior_probability"] for s in ks]
+                 if ks and all("prior_probability" in s for s in ks) else None)
+
+    sections = [
+        _string_table(item_ids),
+        _string_table(state_ids),
+        b"".join(m.to_bytes(width, "little") for m in states),
+        b"".join(m.to_bytes(width, "little") for m in inner),
+        b"".join(m.to_bytes(width, "little") for m in outer),
+        struct.pack(f"<{len(prior)}d", *prior) if prior is not None else b"",
+    ]
+    offsets, pos = [], _TABLE_HEADER.size
+    for section in sections:
+        offsets.append(pos)
+        pos += len(_pad8(section))
+    offsets.append(pos)
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(_TABLE_HEADER.pack(_TABLE_MAGIC, len(item_ids), width,
+                                   len(states), *offsets))
+        for section in sections:
+            f.write(_pad8(section))
+    os.replace(tmp, path)  # open StateTables keep mapping the old file
+
+
+def _pad8(data: bytes) -> bytes:
+    return data + b"\0" * (-len(data) % 8)
+
+
+def _string_table(strings: list[str]) -> bytes:
+    """uint64 count, uint64 offsets[count + 1], then the UTF-8 blob."""
+    blobs = [s.encode("utf-8") for s in strings]
+    offsets = [0]
+    for b in blobs:
+        offsets.append(offsets[-1] + len(b))
+    return struct.pack(f"<Q{len(offsets)}Q", len(strings), *offsets) + b"".join(blobs)
+
+
+class StateTable(Sequence):
+    """
+    Memory-mapped, read-only view of a binary state table written by
+    write_state_table.
+
+    Opening reads only the header and the item IDs; rows are decoded on
+    access. As a sequence it yields knowledge_states[] entries (dicts), so
+    code written against the JSON lists keeps working, while state(),
+    inner(), outer() and masks() hand out the bitmask rows directly.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            st = os.fstat(f.fileno())
+        self._file_id = (st.st_dev, st.st_ino, st.st_mtime_ns, st.st_size)
+        header = _TABLE_HEADER.unpack_from(self._mm)
+        if header[0] != _TABLE_MAGIC:
+            raise ValueError(f"Not a knowledge state table: {path}")
+        self.n_items, self.width, self.n_states = header[1:4]
+        self._offsets = header[4:]
+        self.item_ids = self._strings(0)
+
+    def __len__(self) -> int:
+        return self.n_states
+
+    def __getitem__(self, row):
+        if isinstance(row, slice):
+            return [self[r] for r in range(*row.indices(self.n_states))]
+        if row < 0:
+            row += self.n_states
+        if not 0 <= row < self.n_states:
+            raise IndexError("state row out of range")
+        ids = self.item_ids
+        entry = {
+            "id": self._string(1, row),
+            "items": sorted(ids[j] for j in _iter_bits(self.state(row))),
+            "inner_fringe": sorted(ids[j] for j in _iter_bits(self.inner(row))),
+            "outer_fringe": sorted(ids[j] for j in _iter_bits(self.outer(row))),
+        }
+        if self.has_prior:
+            (entry["prior_probability"],) = struct.unpack_from(
+                "<d", self._mm, self._offsets[5] + 8 * row)
+        return entry
+
+    def state(self, row: int) -> int:
+        """Bitmask of the state in row, over self.item_ids."""
+        return self._row(2, row)
+
+    def inner(self, row: int) -> int:
+        """Inner fringe bitmask of the state in row."""
+        return self._row(3, row)
+
+    def outer(self, row: int) -> int:
+        """Outer fringe bitmask of the state in row."""
+        return self._row(4, row)
+
+    def masks(self, item_ids: list[str], table: str = "states") -> list[int]:
+        """
+        All rows of one bitmask table ('states', 'inner' or 'outer'),
+        re-encoded over item_ids (unknown items are dropped).
+        """
+        section = ("states", "inner", "outer").index(table) + 2
+        start, w = self._offsets[section], self.width
+        raw = [int.from_bytes(self._mm[start + r * w:start + (r + 1) * w], "little")
+               for r in range(self.n_states)]
+        if item_ids == self.item_ids:
+            return raw
+        position = {iid: i for i, iid in enumerate(item_ids)}
+        remap = [position.get(iid) for iid in self.item_ids]
+        out = []
+        for m in raw:
+            r = 0
+            for j in _iter_bits(m):
+                if remap[j] is not None:
+                    r |= 1 << remap[j]
+            out.append(r)
+        return out
+
+    def state_ids(self) -> list[str]:
+        """IDs of all states, in row order."""
+        return self._strings(1)
+
+    @property
+    def has_prior(self) -> bool:
+        """Whether the table stores a prior probability for every state."""
+        start, end = self._offsets[5], self._offsets[6]
+        return bool(self.n_states) and end - start >= 8 * self.n_states
+
+    @property
+    def prior(self) -> list[float] | None:
+        """Stored prior probabilities, or None."""
+        if not self.has_prior:
+            return None
+        return list(struct.unpack_from(f"<{self.n_states}d", self._mm,
+                                       self._offsets[5]))
+
+    def maps(self, path: str) -> bool:
+        """Whether path is (still) the file this table was mapped from."""
+        try:
+            st = os.stat(path)
+        except OSError:
+            return False
+        return (st.st_dev, st.st_ino, st.st_mtime_ns, st.st_size) == self._file_id
+
+    def close(self) -> None:
+        self._mm.close()
+
+    def _row(self, section: int, row: int) -> int:
+        start = self._offsets[section] + row * self.width
+        return int.from_bytes(self._mm[start:start + self.width], "little")
+
+    def _string(self, section: int, k: int) -> str:
+        start = self._offsets[section]
+        lo, hi = struct.unpack_from("<2Q", self._mm, start + 8 + 8 * k)
+        (count,) = struct.unpack_from("<Q", self._mm, start)
+        blob = start + 8 + 8 * (count + 1)
+        return self._mm[blob + lo:blob + hi].decode("utf-8")
+
+    def _strings(self, section: int) -> list[str]:
+        start = self._offsets[section]
+        (count,) = struct.unpack_from("<Q", self._mm, start)
+        offsets = struct.unpack_from(f"<{count + 1}Q", self._mm, start + 8)
+        blob = start + 8 + 8 * (count + 1)
+        data = self._mm[blob:blob + offsets[-1]]
+        return [data[offsets[k]:offsets[k + 1]].decode("utf-8") for k in range(count)]
+
+
+# ---------------------------------------------------------------------------
+# Bitset Surmise Index
+# ---------------------------------------------------------------------------
+
+try:
+    _popcount = int.bit_count
+except AttributeError:  # Python < 3.10
+    def _popcount(mask: int) -> int:
+        return bin(mask).count("1")
+
+
+def _iter_bits(mask: int) -> Iterator[int]:
+    """Yield the positions of the set bits of mask, lowest first."""
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+class CycleError(ValueError):
+    """Raised when adding a surmise relation would create a cycle."""
+
+    def __init__(self, cycle: list[str]):
+        self.cycle = cycle
+        super().__init__("Relation would create a cycle: " + " -> ".join(cycle))
+
+
+class SurmiseIndex:
+    """
+    Bitset representation of a surmise relation and its transitive closure.
+
+    Every item is mapped to a bit position (its index in item_ids). Direct
+    prerequisites and successors, as well as the transitive ancestors and
+    descendants of each item, are stored as Python ints used as bitsets, so
+    whole-domain set operations are single integer operations.
+
+    The closure is computed by propagating ancestor sets forward and
+    descendant sets backward along a topological order (Kahn's algorithm),
+    i.e. O(n + m) bitset operations instead of Warshall's O(n^3). Items on
+    or downstream of a cycle have no topological position and are resolved
+    by fixpoint iteration; an item on a cycle is its own ancestor (see
+    cyclic_mask).
+
+    Relations referencing unknown item IDs are ignored.
+
+    The index can be kept alive while relations are edited: add_relation and
+    remove_relation update the closure in place, touching only the ancestors
+    of the prerequisite and the descendants of the target.
+    """
+
+    def __init__(self, item_ids: Iterable[str],
+                 relations: Iterable[tuple[str, str]]):
+        self.item_ids: list[str] = list(item_ids)
+        self.index: dict[str, int] = {iid: i for i, iid in enumerate(self.item_ids)}
+        n = len(self.item_ids)
+        self.prereq_mask: list[int] = [0] * n
+        self.succ_mask: list[int] = [0] * n
+        for p, t in relations:
+            if p in self.index and t in self.index:
+                pi, ti = self.index[p], self.index[t]
+                self.prereq_mask[ti] |= 1 << pi
+                self.succ_mask[pi] |= 1 << ti
+        self.ancestors: list[int] = [0] * n
+        self.descendants: list[int] = [0] * n
+        self._topo_order: list[int] | None = None
+        self._byte_tables: list[list[tuple[str, ...]]] | None = None
+        self._compute_closure()
+
+    def __getstate__(self) -> dict:
+        state = self.__dict__.copy()
+        state["_byte_tables"] = None  # rebuilt on first ids() call
+        return state
+
+    def to_dict(self) -> dict:
+        """The item order, direct relations and closure as plain data."""
+        return {"item_ids": self.item_ids, "prereq_mask": self.prereq_mask,
+                "succ_mask": self.succ_mask, "ancestors": self.ancestors,
+                "descendants": self.descendants}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "SurmiseIndex":
+        """Rebuild an index from to_dict() output without recomputing the closure."""
+        index = cls.__new__(cls)
+        index.item_ids = list(data["item_ids"])
+        index.index = {iid: i for i, iid in enumerate(index.item_ids)}
+        for name in ("prereq_mask", "succ_mask", "ancestors", "descendants"):
+            setattr(index, name, list(data[name]))
+        index._topo_order = None
+        index._byte_tables = None
+        return index
+
+    @classmethod
+    def from_graph(cls, graph: dict) -> "SurmiseIndex":
+        """Build the index over graph["items"] and graph["surmise_relations"]."""
+        relations = graph.get("surmise_relations", [])
+        with profile_phase("surmise_index"):
+            profile_count("items", len(graph["items"]))
+            profile_count("relations_scanned", len(relations))
+            return cls(
+                (item["id"] for item in graph["items"]),
+                ((rel["prerequisite"], rel["target"]) for rel in relations),
+            )
+
+    def __len__(self) -> int:
+        return len(self.item_ids)
+
+    @property
+    def full_mask(self) -> int:
+        """Bitset containing every item of the domain."""
+        return (1 << len(self.item_ids)) - 1
+
+    @property
+    def cyclic_mask(self) -> int:
+        """Bitset of items that lie on a cycle of the relation."""
+        mask = 0
+        for i, anc in enumerate(self.ancestors):
+            if anc >> i & 1:
+                mask |= 1 << i
+        return mask
+
+    def mask(self, ids: Iterable[str]) -> int:
+        """Encode item IDs as a bitset (unknown IDs are ignored)."""
+        m = 0
+        for iid in ids:
+            i = self.index.get(iid)
+            if i is not None:
+                m |= 1 << i
+        return m
+
+    def ids(self, mask: int) -> list[str]:
+        """Decode a bitset into item IDs, in bit order."""
+        if self._byte_tables is None:
+            self._byte_tables = [
+                [tuple(self.item_ids[base + i] for i in _iter_bits(b)
+                       if base + i < len(self.item_ids))
+                 for b in range(256)]
+                for base in range(0, len(self.item_ids), 8)
+            ]
+        tables = self._byte_tables
+        out: list[str] = []
+        for k, b in enumerate(mask.to_bytes(len(tables), "little")):
+            if b:
+                out.extend(tables[k][b])
+        return out
+
+    @property
+    def topo_order(self) -> list[int]:
+        """Bit positions in topological order (items on cycles omitted)."""
+        if self._topo_order is None:
+            self._topo_order = self._local_order(self.full_mask, self.prereq_mask,
+                                                 self.succ_mask)
+        return self._topo_order
+
+    def add_item(self, item_id: str) -> int:
+        """Append a new item with no relations and return its bit position."""
+        if item_id in self.index:
+            raise ValueError(f"Item already indexed: {item_id}")
+        self.index[item_id] = len(self.item_ids)
+        self.item_ids.append(item_id)
+        for masks in (self.prereq_mask, self.succ_mask,
+                      self.ancestors, self.descendants):
+            masks.append(0)
+        self._topo_order = None
+        self._byte_tables = None
+        return self.index[item_id]
 
+    def add_relation(self, prerequisite: str, target: str) -> bool:
+        """
+        Add prerequisite -> target and update the closure incrementally.
 
-def save_graph(graph: dict, path: str) -> None:
-    """Save a knowledge graph JSON file with pretty formatting."""
-    with open(path, "w") as f:
-        json.dump(graph, f, indent=2, ensure_ascii=False)
-    print(f"Saved graph to {path}")
+        Every (a, d) with a in ancestors(prerequisite) + {prerequisite} and
+        d in descendants(target) + {target} becomes reachable; nothing else
+        changes. Raises CycleError (leaving the index untouched) if target
+        already reaches prerequisite. Returns False if the relation was
+        already present.
+        """
+        p, t = self._position(prerequisite), self._position(target)
+        if self.succ_mask[p] >> t & 1:
+            return False
+        if p == t or self.descendants[t] >> p & 1:
+            raise CycleError(self._path_ids(t, p) + [target])
+        self.prereq_mask[t] |= 1 << p
+        self.succ_mask[p] |= 1 << t
+        self._topo_order = None
+        if self.descendants[p] >> t & 1:
+            return True  # already implied; closure unchanged
+        up = self.ancestors[p] | (1 << p)
+        down = self.descendants[t] | (1 << t)
+        for d in _iter_bits(down):
+            self.ancestors[d] |= up
+        for a in _iter_bits(up):
+            self.descendants[a] |= down
+        return True
+
+    def remove_relation(self, prerequisite: str, target: str) -> bool:
+        """
+        Remove prerequisite -> target and update the closure incrementally.
+
+        Only the ancestor sets of target and its descendants, and the
+        descendant sets of prerequisite and its ancestors, are recomputed
+        (in local topological order). Returns False if the relation was not
+        present as a direct relation.
+        """
+        p, t = self._position(prerequisite), self._position(target)
+        if not self.succ_mask[p] >> t & 1:
+            return False
+        self.prereq_mask[t] &= ~(1 << p)
+        self.succ_mask[p] &= ~(1 << t)
+        self._topo_order = None
+        if self.cyclic_mask:
+            self.ancestors = [0] * len(self.item_ids)
+            self.descendants = [0] * len(self.item_ids)
+            self._compute_closure()
+            return True
+
+        down = self.descendants[t] | (1 << t)
+        up = self.ancestors[p] | (1 << p)
+        anc, desc = self.ancestors, self.descendants
+        for i in self._local_order(down, self.prereq_mask, self.succ_mask):
+            m = 0
+            for q in _iter_bits(self.prereq_mask[i]):
+                m |= anc[q] | (1 << q)
+            anc[i] = m
+        for i in self._local_order(up, self.succ_mask, self.prereq_mask):
+            m = 0
+            for s in _iter_bits(self.succ_mask[i]):
+                m |= desc[s] | (1 << s)
+            desc[i] = m
+        return True
+
+    def _path_ids(self, source: int, dest: int) -> list[str]:
+        """Item IDs on a shortest path source -> dest of direct relations."""
+        allowed = (self.descendants[source] & (self.ancestors[dest] | (1 << dest))) \
+            | (1 << source)
+        parent = {source: source}
+        frontier = [source]
+        while frontier and dest not in parent:
+            nxt = []
+            for u in frontier:
+                for v in _iter_bits(self.succ_mask[u] & allowed):
+                    if v not in parent:
+                        parent[v] = u
+                        nxt.append(v)
+            frontier = nxt
+        path = [dest]
+        while path[-1] != source:
+            path.append(parent[path[-1]])
+        return [self.item_ids[i] for i in reversed(path)]
+
+    def _position(self, item_id: str) -> int:
+        try:
+            return self.index[item_id]
+        except KeyError:
+            raise ValueError(f"Unknown item ID: {item_id}") from None
+
+    @staticmethod
+    def _local_order(nodes: int, edges: list[int],
+                     reverse: list[int]) -> list[int]:
+        """Order nodes so each follows its edges-neighbours inside nodes."""
+        pending = {i: _popcount(edges[i] & nodes) for i in _iter_bits(nodes)}
+        order = [i for i, k in pending.items() if k == 0]
+        for i in order:
+            for j in _iter_bits(reverse[i] & nodes):
+                pending[j] -= 1
+                if pending[j] == 0:
+                    order.append(j)
+        return order
+
+    def _compute_closure(self) -> None:
+        n = len(self.item_ids)
+        prereq, succ = self.prereq_mask, self.succ_mask
+        anc, desc = self.ancestors, self.descendants
+
+        # Kahn's algorithm; items left out are on or downstream of a cycle.
+        order = self.topo_order
+        placed = 0
+        for i in order:
+            placed |= 1 << i
+        rest = [i for i in range(n) if not placed >> i & 1]
+
+        for i in order:
+            m = 0
+            for p in _iter_bits(prereq[i]):
+                m |= anc[p] | (1 << p)
+            anc[i] = m
+        _fixpoint(rest, prereq, anc)
+
+        # Successors of cyclic items are cyclic-or-downstream themselves,
+        # so resolve those first, then sweep the acyclic part backwards.
+        _fixpoint(rest, succ, desc)
+        for i in reversed(order):
+            m = 0
+            for s in _iter_bits(succ[i]):
+                m |= desc[s] | (1 << s)
+            desc[i] = m
+
+
+def _fixpoint(nodes: list[int], edges: list[int], reach: list[int]) -> None:
+    """Propagate reach[i] |= reach[j] | {j} over edges[i] until stable."""
+    changed = bool(nodes)
+    while changed:
+        changed = False
+        for i in nodes:
+            m = reach[i]
+            for j in _iter_bits(edges[i]):
+                m |= reach[j] | (1 << j)
+            if m != reach[i]:
+                reach[i] = m
+                changed = True
 
 
 # ---------------------------------------------------------------------------
 # Surmise Relation Operations
 # ---------------------------------------------------------------------------
 
-def build_adjacency(graph: dict) -> dict[str, set[str]]:
-    """Build prerequisite adjacency: adj[target] = {prerequisites}."""
+def build_adjacency(graph: dict,
+                    index: SurmiseIndex | None = None) -> dict[str, set[str]]:
+    """
+    Build prerequisite adjacency: adj[target] = {prerequisites}.
+
+    If a SurmiseIndex is given, the adjacency is decoded from its bitsets
+    (relations referencing unknown items are then omitted).
+    """
     adj: dict[str, set[str]] = defaultdict(set)
-    for rel in graph.get("surmise_relations", []):
-        adj[rel["target"]].add(rel["prerequisite"])
+    with profile_phase("build_adjacency"):
+        if index is not None:
+            for i, mask in enumerate(index.prereq_mask):
+                if mask:
+                    adj[index.item_ids[i]].update(index.ids(mask))
+            return adj
+        relations = graph.get("surmise_relations", [])
+        profile_count("relations_scanned", len(relations))
+        for rel in relations:
+            adj[rel["target"]].add(rel["prerequisite"])
     return adj
 
 
@@ -63,91 +946,285 @@ def build_successor_map(graph: dict) -> dict[str, set[str]]:
     return succ
 
 
-def transitive_closure(graph: dict) -> list[dict]:
+def transitive_closure(graph: dict,
+                       index: SurmiseIndex | None = None) -> list[dict]:
     """
     Compute the transitive closure of surmise relations.
     Returns list of new relations to add (only those not already present).
-    Uses Warshall's algorithm.
+    Uses the bitset closure of a SurmiseIndex (built if not given).
     """
-    item_ids = [item["id"] for item in graph["items"]]
-    n = len(item_ids)
-    idx = {iid: i for i, iid in enumerate(item_ids)}
+    if index is None:
+        index = SurmiseIndex.from_graph(graph)
+    item_ids = index.item_ids
 
-    # Build reachability matrix from existing relations
-    reach = [[False] * n for _ in range(n)]
-    existing_pairs = set()
-    for rel in graph.get("surmise_relations", []):
-        p, t = rel["prerequisite"], rel["target"]
-        if p in idx and t in idx:
-            reach[idx[p]][idx[t]] = True
-            existing_pairs.add((p, t))
-
-    # Warshall's algorithm
-    for k in range(n):
-        for i in range(n):
-            for j in range(n):
-                if reach[i][k] and reach[k][j]:
-                    reach[i][j] = True
-
-    # Collect new transitive relations
-    new_relations = []
-    for i in range(n):
-        for j in range(n):
-            if i != j and reach[i][j]:
-                pair = (item_ids[i], item_ids[j])
-                if pair not in existing_pairs:
-                    new_relations.append({
-                        "prerequisite": pair[0],
-                        "target": pair[1],
-                        "confidence": 1.0,
-                        "rationale": f"Transitive closure",
-                        "relation_type": "prerequisite-of",
-                        "source": "transitive-closure"
-                    })
+    # Collect new transitive relations: descendants that are neither the
+    # item itself nor already a direct successor.
+    with profile_phase("transitive_closure"):
+        new_relations = []
+        for i, desc in enumerate(index.descendants):
+            missing = desc & ~index.succ_mask[i] & ~(1 << i)
+            for j in _iter_bits(missing):
+                new_relations.append({
+                    "prerequisite": item_ids[i],
+                    "target": item_ids[j],
+                    "confidence": 1.0,
+                    "rationale": f"Transitive closure",
+                    "relation_type": "prerequisite-of",
+                    "source": "transitive-closure"
+                })
+        profile_count("bitset_rows", len(index.descendants))  # one AND-NOT each
+        profile_count("implied_relations", len(new_relations))
 
     return new_relations
 
 
-def detect_cycles(graph: dict) -> list[list[str]]:
+def transitive_reduction(graph: dict,
+                         index: SurmiseIndex | None = None) -> list[dict]:
     """
-    Detect cycles in the surmise relation using DFS.
-    Returns list of cycles found (each cycle is a list of item IDs).
-    An empty list means the relation is acyclic (valid).
+    Compute the transitive reduction (Hasse diagram) of the surmise relation.
+    Returns the relations to keep, in their original order; duplicates and
+    relations implied by others are dropped. Relations referencing unknown
+    items are kept untouched.
+
+    p -> t is implied iff t is a descendant of another direct successor of
+    p, so each item needs one OR over its successors' descendant bitsets.
+    The closure, and hence every downset, is unchanged. Raises ValueError
+    if the relation has a cycle (its reduction is then not unique).
     """
-    adj = build_successor_map(graph)
-    item_ids = {item["id"] for item in graph["items"]}
+    if index is None:
+        index = SurmiseIndex.from_graph(graph)
+    if index.cyclic_mask:
+        raise ValueError("Transitive reduction requires an acyclic relation")
+    implied = []
+    for succ in index.succ_mask:
+        m = 0
+        for s in _iter_bits(succ):
+            m |= index.descendants[s]
+        implied.append(m)
 
-    WHITE, GRAY, BLACK = 0, 1, 2
-    color = {iid: WHITE for iid in item_ids}
-    parent = {}
-    cycles = []
+    kept, seen = [], set()
+    for rel in graph.get("surmise_relations", []):
+        p, t = index.index.get(rel["prerequisite"]), index.index.get(rel["target"])
+        if p is None or t is None:
+            kept.append(rel)
+        elif (p, t) not in seen and not implied[p] >> t & 1:
+            seen.add((p, t))
+            kept.append(rel)
+    return kept
 
-    def dfs(u, path):
-        color[u] = GRAY
-        path.append(u)
-        for v in adj.get(u, set()):
-            if v not in color:
-                continue
-            if color[v] == GRAY:
-                # Found cycle: extract it from path
-                cycle_start = path.index(v)
-                cycles.append(path[cycle_start:] + [v])
-            elif color[v] == WHITE:
-                dfs(v, path)
-        path.pop()
-        color[u] = BLACK
 
-    for iid in item_ids:
-        if color[iid] == WHITE:
-            dfs(iid, [])
+def detect_cycles(graph: dict,
+                  index: SurmiseIndex | None = None) -> list[list[str]]:
+    """
+    Detect cycles in the surmise relation.
+    Returns the cyclic strongly connected components, each once, as lists
+    of item IDs in item order (an item with a self-loop is a component of
+    its own). An empty list means the relation is acyclic (valid).
 
+    Components come from an iterative Tarjan pass (see _cycle_analysis),
+    so deep prerequisite chains cannot hit the recursion limit. If a
+    SurmiseIndex is given and its closure has no cyclic items, the pass is
+    skipped.
+    """
+    if index is not None and not index.cyclic_mask:
+        return []
+    with profile_phase("detect_cycles"):
+        cycles = _cycle_analysis(graph)[0]
+        profile_count("relations_scanned", len(graph.get("surmise_relations", [])))
+        profile_count("cyclic_components", len(cycles))
     return cycles
 
 
+def cycle_breaking_edges(graph: dict) -> list[tuple[str, str]]:
+    """
+    A minimal set of (prerequisite, target) relations whose removal makes
+    the surmise relation acyclic: removing all of them breaks every cycle,
+    and keeping any one of them back would leave a cycle.
+
+    Starts from the back edges of the DFS in _cycle_analysis (which already
+    break every cycle) and, per component, re-adds each one to a
+    SurmiseIndex of the remaining relations, keeping only those whose
+    re-insertion raises CycleError.
+    """
+    item_ids = [item["id"] for item in graph["items"]]
+    components, back_edges = _cycle_analysis(graph)
+    component_of = {iid: k for k, comp in enumerate(components) for iid in comp}
+    removed = set(back_edges)
+    inner: dict[int, list[tuple[str, str]]] = defaultdict(list)
+    for rel in graph.get("surmise_relations", []):
+        pair = (rel["prerequisite"], rel["target"])
+        k = component_of.get(pair[0])
+        if k is not None and k == component_of.get(pair[1]) and pair not in removed:
+            inner[k].append(pair)
+
+    candidates: dict[int, list[tuple[str, str]]] = defaultdict(list)
+    for p, t in back_edges:
+        candidates[component_of[p]].append((p, t))
+
+    breaking = []
+    for k, comp in enumerate(components):
+        index = SurmiseIndex(comp, inner[k])
+        for p, t in candidates[k]:
+            try:
+                index.add_relation(p, t)
+            except CycleError:
+                breaking.append((p, t))
+    order = {iid: i for i, iid in enumerate(item_ids)}
+    return sorted(breaking, key=lambda e: (order[e[0]], order[e[1]]))
+
+
+def _cycle_analysis(graph: dict) -> tuple[list[list[str]], list[tuple[str, str]]]:
+    """
+    One iterative DFS over the relation computing Tarjan's strongly
+    connected components and the DFS back edges, in O(items + relations).
+
+    Returns (cyclic components, back edges). Every cycle contains a back
+    edge, and every back edge lies inside a cyclic component.
+    """
+    item_ids = [item["id"] for item in graph["items"]]
+    position = {iid: i for i, iid in enumerate(item_ids)}
+    succ: list[dict[int, None]] = [{} for _ in item_ids]
+    for rel in graph.get("surmise_relations", []):
+        p, t = position.get(rel["prerequisite"]), position.get(rel["target"])
+        if p is not None and t is not None:
+            succ[p][t] = None
+    successors = [list(s) for s in succ]
+
+    n = len(item_ids)
+    order = [-1] * n      # DFS discovery number
+    low = [0] * n
+    on_stack = [False] * n
+    on_path = [False] * n
+    stack: list[int] = []
+    components: list[list[str]] = []
+    back_edges: list[tuple[str, str]] = []
+    counter = 0
+    for root in range(n):
+        if order[root] >= 0:
+            continue
+        order[root] = low[root] = counter
+        counter += 1
+        stack.append(root)
+        on_stack[root] = on_path[root] = True
+        work = [[root, 0]]
+        while work:
+            frame = work[-1]
+            v, i = frame
+            if i < len(successors[v]):
+                frame[1] = i + 1
+                w = successors[v][i]
+                if order[w] < 0:
+                    order[w] = low[w] = counter
+                    counter += 1
+                    stack.append(w)
+                    on_stack[w] = on_path[w] = True
+                    work.append([w, 0])
+                    continue
+                if on_path[w]:
+                    back_edges.append((item_ids[v], item_ids[w]))
+                if on_stack[w] and order[w] < low[v]:
+                    low[v] = order[w]
+                continue
+            work.pop()
+            on_path[v] = False
+            if work:
+                u = work[-1][0]
+                if low[v] < low[u]:
+                    low[u] = low[v]
+            if low[v] == order[v]:
+                comp = []
+                while True:
+                    w = stack.pop()
+                    on_stack[w] = False
+                    comp.append(w)
+                    if w == v:
+                        break
+                if len(comp) > 1 or v in succ[v]:
+                    components.append([item_ids[w] for w in sorted(comp)])
+    return components, back_edges
+
+
 # ---------------------------------------------------------------------------
 # Knowledge State Enumeration
 # ---------------------------------------------------------------------------
 
+def iter_downsets(graph: dict,
+                  index: SurmiseIndex | None = None) -> Iterator[int]:
+    """
+    Stream all downward-closed sets (feasible knowledge states) as bitsets
+    over index.item_ids.
+
+    Each downset is produced exactly once without remembering visited
+    states: from a state K with forbidden items F, the downsets above K
+    that avoid F are partitioned by the first addable item c_i they contain,
+    and the i-th branch continues from K + {c_i} with c_1..c_(i-1) forbidden.
+    The addable set (items whose prerequisites are all in K) is maintained
+    incrementally from the successors of the item just added, so the work
+    per state is proportional to its branching, and memory is one stack
+    frame per item in the current state.
+
+    Items on a cycle (and everything above them) never become addable.
+    """
+    if index is None:
+        index = SurmiseIndex.from_graph(graph)
+    for state, _, _ in _walk_downsets(index):
+        yield state
+
+
+def iter_states_with_fringes(
+    graph: dict,
+    index: SurmiseIndex | None = None
+) -> Iterator[tuple[int, int, int]]:
+    """
+    Stream (state, inner_fringe, outer_fringe) bitset triples for every
+    downset, in the same order as iter_downsets.
+
+    In a downset lattice the outer fringe of K is exactly the set of
+    addable items, and the inner fringe is the set of items of K with no
+    successor in K. Both are maintained in O(1) bitset operations per
+    step: adding x makes x maximal and demotes its direct prerequisites.
+    """
+    if index is None:
+        index = SurmiseIndex.from_graph(graph)
+    for state, outer, inner in _walk_downsets(index):
+        yield state, inner, outer
+
+
+def _walk_downsets(index: SurmiseIndex) -> Iterator[tuple[int, int, int]]:
+    """Yield (state, addable items, maximal items) for every downset."""
+    prereq, succ = index.prereq_mask, index.succ_mask
+    addable = 0
+    for i, mask in enumerate(prereq):
+        if not mask:
+            addable |= 1 << i
+
+    yield 0, addable, 0
+    # Frame: [state, addable items, maximal items, forbidden items,
+    #         untried candidates]
+    stack = [[0, addable, 0, 0, addable]]
+    while stack:
+        frame = stack[-1]
+        candidates = frame[4]
+        if not candidates:
+            stack.pop()
+            continue
+        low = candidates & -candidates
+        state, addable, maximal, forbidden = frame[0], frame[1], frame[2], frame[3]
+        frame[3] = forbidden | low
+        frame[4] = candidates ^ low
+
+        x = low.bit_length() - 1
+        child = state | low
+        child_addable = addable ^ low
+        for j in _iter_bits(succ[x]):
+            if not prereq[j] & ~child:
+                child_addable |= 1 << j
+        child_maximal = (maximal & ~prereq[x]) | low
+        yield child, child_addable, child_maximal
+        stack.append([child, child_addable, child_maximal, forbidden,
+                      child_addable & ~forbidden])
+
+
 def enumerate_downsets(graph: dict, max_states: int = 10000) -> list[frozenset[str]]:
     """
     Enumerate all downward-closed sets (feasible knowledge states)
@@ -156,34 +1233,266 @@ def enumerate_downsets(graph: dict, max_states: int = 10000) -> list[frozenset[s
     A set K is downward-closed if: for every item b in K,
     all prerequisites of b are also in K.
 
-    Uses BFS from the empty set, adding one valid item at a time.
-    Stops if max_states is exceeded (returns partial results with warning).
+    Collects the stream from iter_downsets, sorted by size then items.
+    Stops with a warning once max_states states are collected. The result
+    is then the first max_states states of the depth-first walk, not the
+    smallest ones: the empty state, then states grown by repeatedly adding
+    the earliest addable item (in graph["items"] order). Every returned
+    state is feasible, but larger states built from early items are
+    over-represented and whole layers of the lattice may be missing.
     """
-    adj = build_adjacency(graph)
-    item_ids = {item["id"] for item in graph["items"]}
+    index = SurmiseIndex.from_graph(graph)
+    masks = []
+    for mask in iter_downsets(graph, index):
+        if len(masks) >= max_states:
+            _warn_enumeration_stopped(max_states)
+            break
+        masks.append(mask)
+
+    states = [frozenset(index.ids(mask)) for mask in masks]
+    return sorted(states, key=lambda s: (len(s), sorted(s)))
 
-    # Items with no prerequisites can be added first
-    states: set[frozenset[str]] = set()
-    queue = [frozenset()]
-    states.add(frozenset())
 
-    while queue:
-        if len(states) >= max_states:
-            print(f"WARNING: State enumeration stopped at {max_states} states. "
-                  f"Domain may be too large for full enumeration.", file=sys.stderr)
-            break
+def _feasible_mask(index: SurmiseIndex) -> int:
+    """Items that occur in some downset, i.e. not on or above a cycle."""
+    blocked = index.cyclic_mask
+    for i in _iter_bits(blocked):
+        blocked |= index.descendants[i]
+    return index.full_mask & ~blocked
 
-        current = queue.pop(0)
-        # Find items that can be added (all prerequisites satisfied)
-        for iid in item_ids - current:
-            prereqs = adj.get(iid, set())
-            if prereqs <= current:  # All prerequisites in current state
-                new_state = current | {iid}
-                if new_state not in states:
-                    states.add(new_state)
-                    queue.append(new_state)
 
-    return sorted(states, key=lambda s: (len(s), sorted(s)))
+class _DownsetCounter:
+    """
+    Exact downset counting by decomposition of the (transitively closed)
+    sub-poset induced on a bitset of items.
+
+    - incomparable components multiply: I(A + B) = I(A) * I(B)
+    - a chain of k items has k + 1 downsets, a single item has 2
+    - otherwise split on the pivot p comparable to the most items:
+      I(C) = I(C - p - above(p)) + I(C - p - below(p))
+      (downsets without p, plus downsets containing p and all of below(p))
+
+    Sub-posets are memoized by bitset, so chains, many small components and
+    posets of bounded width reduce to few distinct subproblems. Evaluation
+    is iterative, so deep posets do not hit the recursion limit.
+    """
+
+    def __init__(self, index: SurmiseIndex):
+        self.ancestors = index.ancestors
+        self.descendants = index.descendants
+        self.comparable = [a | d for a, d in zip(index.ancestors, index.descendants)]
+        # comp -> count; comp -> ("chain", order) or (pivot, without, with_)
+        self.memo: dict[int, int] = {}
+        self.plans: dict[int, tuple] = {}
+
+    def components(self, mask: int) -> list[int]:
+        """Split mask into connected components of the comparability graph."""
+        comps = []
+        while mask:
+            comp = frontier = mask & -mask
+            while frontier:
+                reach = 0
+                for i in _iter_bits(frontier):
+                    reach |= self.comparable[i]
+                frontier = reach & mask & ~comp
+                comp |= frontier
+            comps.append(comp)
+            mask &= ~comp
+        return comps
+
+    def count(self, mask: int) -> int:
+        total = 1
+        for comp in self.components(mask):
+            self._evaluate(comp)
+            total *= self.memo[comp]
+        return total
+
+    def _plan(self, comp: int) -> tuple:
+        plan = self.plans.get(comp)
+        if plan is not None:
+            return plan
+        size = _popcount(comp)
+        pivot, best = -1, -1
+        for i in _iter_bits(comp):
+            k = _popcount(self.comparable[i] & comp)
+            if k > best:
+                pivot, best = i, k
+        if best == size - 1 and all(
+                _popcount(self.comparable[i] & comp) == size - 1
+                for i in _iter_bits(comp)):
+            order = sorted(_iter_bits(comp),
+                           key=lambda i: _popcount(self.ancestors[i] & comp))
+            plan = ("chain", order)
+        else:
+            bit = 1 << pivot
+            plan = (pivot,
+                    self.components(comp & ~bit & ~self.descendants[pivot]),
+                    self.components(comp & ~bit & ~self.ancestors[pivot]))
+        self.plans[comp] = plan
+        return plan
+
+    def _evaluate(self, comp: int) -> None:
+        memo = self.memo
+        stack = [comp]
+        while stack:
+            c = stack[-1]
+            if c in memo:
+                stack.pop()
+                continue
+            plan = self._plan(c)
+            if plan[0] == "chain":
+                memo[c] = len(plan[1]) + 1
+                stack.pop()
+                continue
+            missing = [x for x in plan[1] + plan[2] if x not in memo]
+            if missing:
+                stack.extend(missing)
+                continue
+            without, with_ = 1, 1
+            for x in plan[1]:
+                without *= memo[x]
+            for x in plan[2]:
+                with_ *= memo[x]
+            memo[c] = without + with_
+            stack.pop()
+
+    def sample(self, mask: int, rng: random.Random) -> int:
+        """Draw one downset of mask uniformly at random."""
+        self.count(mask)
+        state = 0
+        stack = self.components(mask)
+        while stack:
+            comp = stack.pop()
+            plan = self._plan(comp)
+            if plan[0] == "chain":
+                for i in plan[1][:rng.randrange(len(plan[1]) + 1)]:
+                    state |= 1 << i
+                continue
+            pivot, without, with_ = plan
+            n_without = 1
+            for x in without:
+                n_without *= self.memo[x]
+            if rng.randrange(self.memo[comp]) < n_without:
+                stack.extend(without)
+            else:
+                state |= (1 << pivot) | (self.ancestors[pivot] & comp)
+                stack.extend(with_)
+        return state
+
+
+def count_states(graph: dict, index: SurmiseIndex | None = None) -> int:
+    """
+    Count the feasible knowledge states (downsets) exactly, without
+    enumerating them. See _DownsetCounter for the decomposition used.
+    """
+    if index is None:
+        index = SurmiseIndex.from_graph(graph)
+    with profile_phase("count_states"):
+        return _DownsetCounter(index).count(_feasible_mask(index))
+
+
+def sample_states(
+    graph: dict,
+    k: int,
+    seed: int | None = None,
+    index: SurmiseIndex | None = None
+) -> list[frozenset[str]]:
+    """
+    Draw k knowledge states uniformly at random (with replacement),
+    without enumerating the state space.
+
+    Each draw walks the same decomposition as count_states, choosing each
+    branch with probability proportional to its exact downset count.
+    """
+    if index is None:
+        index = SurmiseIndex.from_graph(graph)
+    counter = _DownsetCounter(index)
+    feasible = _feasible_mask(index)
+    rng = random.Random(seed)
+    return [frozenset(index.ids(counter.sample(feasible, rng))) for _ in range(k)]
+
+
+class FringeIndex:
+    """
+    Knowledge states stored as bitset rows alongside their inner and outer
+    fringes, with O(1) lookup of a state's row.
+
+    Built in one pass over iter_states_with_fringes; no per-item membership
+    tests against the state family are needed.
+    """
+
+    def __init__(self, index: SurmiseIndex, states: list[int],
+                 inner: list[int], outer: list[int], truncated: bool = False):
+        self.index = index
+        self.states = states
+        self.inner = inner
+        self.outer = outer
+        self.truncated = truncated  # stopped at max_states
+        self.rows = {state: row for row, state in enumerate(states)}
+
+    @classmethod
+    def from_graph(
+        cls,
+        graph: dict,
+        index: SurmiseIndex | None = None,
+        max_states: int | None = None
+    ) -> "FringeIndex":
+        """Enumerate the downset lattice of graph with fringes attached."""
+        if index is None:
+            index = SurmiseIndex.from_graph(graph)
+        states, inner, outer = [], [], []
+        truncated = False
+        with profile_phase("enumerate_states"):
+            for state, inn, out in iter_states_with_fringes(graph, index):
+                if max_states is not None and len(states) >= max_states:
+                    _warn_enumeration_stopped(max_states)
+                    truncated = True
+                    break
+                states.append(state)
+                inner.append(inn)
+                outer.append(out)
+            profile_count("states_visited", len(states))
+        return cls(index, states, inner, outer, truncated)
+
+    def __len__(self) -> int:
+        return len(self.states)
+
+    def __contains__(self, state: int) -> bool:
+        return state in self.rows
+
+    def fringes(self, state: int) -> tuple[int, int]:
+        """Return (inner, outer) fringe bitsets of a stored state."""
+        row = self.rows[state]
+        return self.inner[row], self.outer[row]
+
+    def sort(self) -> None:
+        """Reorder rows by state size, then sorted item IDs."""
+        ids = self.index.ids
+        order = sorted(range(len(self.states)),
+                       key=lambda r: (_popcount(self.states[r]),
+                                      sorted(ids(self.states[r]))))
+        self.states = [self.states[r] for r in order]
+        self.inner = [self.inner[r] for r in order]
+        self.outer = [self.outer[r] for r in order]
+        self.rows = {state: row for row, state in enumerate(self.states)}
+
+    def knowledge_states(self) -> list[dict]:
+        """Render the rows as schema knowledge_states[] entries."""
+        ids = self.index.ids
+        return [
+            {
+                "id": f"state-{row:04d}",
+                "items": sorted(ids(state)),
+                "inner_fringe": sorted(ids(self.inner[row])),
+                "outer_fringe": sorted(ids(self.outer[row])),
+            }
+            for row, state in enumerate(self.states)
+        ]
+
+
+def _warn_enumeration_stopped(max_states: int) -> None:
+    print(f"WARNING: State enumeration stopped at {max_states} states. "
+          f"Domain may be too large for full enumeration.", file=sys.stderr)
 
 
 def compute_fringes(
@@ -213,187 +1522,1568 @@ def compute_fringes(
 
 
 # ---------------------------------------------------------------------------
-# Learning Path Generation
+# Knowledge Space Base
 # ---------------------------------------------------------------------------
 
-def generate_learning_paths(
-    graph: dict,
-    all_states: list[frozenset[str]],
-    strategy: str = "breadth-first",
-    max_paths: int = 5
-) -> list[list[str]]:
+def compute_base(states: Iterable[int]) -> list[int]:
     """
-    Generate learning paths (maximal chains from empty set to Q).
+    Base of a family of bitset states, smallest first: the union-irreducible
+    members, i.e. those that are not the union of the members strictly
+    below them. Every member of a knowledge space is the union of the base
+    states it contains, so the space is spanned by its base.
 
-    Strategies:
-    - 'breadth-first': prefer items from underrepresented topics
-    - 'depth-first': prefer items continuing current topic
-    - 'max-unlock': prefer items that unlock the most new items
+    States are visited by size and one is kept iff the base states found so
+    far that it contains do not cover it: O(|states| x |base|).
     """
-    adj = build_adjacency(graph)
-    succ = build_successor_map(graph)
-    item_ids = {item["id"] for item in graph["items"]}
-    state_set = set(all_states)
+    base: list[int] = []
+    for state in sorted(set(states), key=_popcount):
+        covered = 0
+        for b in base:
+            if not b & ~state:
+                covered |= b
+        if covered != state:
+            base.append(state)
+    return base
 
-    full_domain = frozenset(item_ids)
-    if full_domain not in state_set:
-        print("WARNING: Full domain is not a valid state. Paths may be partial.",
-              file=sys.stderr)
 
-    paths = []
+def compute_atoms(base: Iterable[int], n_items: int) -> list[list[int]]:
+    """
+    Atoms of every item (the minimal states containing it), aligned with
+    item positions. Every atom of a knowledge space is a base state, so the
+    atoms are the minimal base states containing each item.
+    """
+    atoms: list[list[int]] = [[] for _ in range(n_items)]
+    for b in sorted(base, key=_popcount):
+        for q in _iter_bits(b):
+            if all(a & ~b for a in atoms[q]):
+                atoms[q].append(b)
+    return atoms
 
-    def build_path(score_fn) -> list[str]:
-        """Build a single path using a scoring function for item selection."""
-        current = frozenset()
-        path = []
-        while current != full_domain:
-            # Find addable items
-            candidates = []
-            for iid in item_ids - current:
-                prereqs = adj.get(iid, set())
-                if prereqs <= current:
-                    candidate_state = current | {iid}
-                    if candidate_state in state_set:
-                        candidates.append(iid)
-            if not candidates:
+
+class KnowledgeBase:
+    """
+    A knowledge space stored as its base, with states regenerated on demand.
+
+    Membership, the interior of an item set (the largest state inside it)
+    and the fringes of a state each take one pass over the base, so an
+    assessment can work in the neighbourhood of the states it visits
+    without the space being enumerated. iter_states regenerates the whole
+    space lazily, one state at a time, in lectic order (Ganter's
+    NextClosure on the complements of the states).
+
+    Any generating family may be passed as base; it is reduced to the
+    union-irreducible states of its span.
+    """
+
+    def __init__(self, item_ids: Iterable[str], base: Iterable[int]):
+        self.item_ids = list(item_ids)
+        self.index = {iid: i for i, iid in enumerate(self.item_ids)}
+        self.base = compute_base(base)
+        self.atoms = compute_atoms(self.base, len(self.item_ids))
+
+    @classmethod
+    def from_graph(cls, graph: dict,
+                   index: SurmiseIndex | None = None) -> "KnowledgeBase":
+        """
+        Use graph["state_base"] if stored, otherwise the base of
+        graph["knowledge_states"], otherwise the base of the downset space
+        of the surmise relation (the downward closure of each item).
+        """
+        if index is None:
+            index = SurmiseIndex.from_graph(graph)
+        stored = graph.get("state_base") or graph.get("knowledge_states")
+        if isinstance(stored, StateTable):
+            base = stored.masks(index.item_ids)
+        elif stored:
+            base = [index.mask(s["items"]) for s in stored]
+        else:
+            base = [(1 << j) | index.ancestors[j]
+                    for j in _iter_bits(_feasible_mask(index))]
+        return cls(index.item_ids, base)
+
+    def __len__(self) -> int:
+        return len(self.base)
+
+    def __contains__(self, state: int) -> bool:
+        return self.interior(state) == state
+
+    def interior(self, mask: int) -> int:
+        """Largest state contained in mask: the union of its base states."""
+        out = 0
+        for b in self.base:
+            if not b & ~mask:
+                out |= b
+        return out
+
+    def fringes(self, state: int) -> tuple[int, int]:
+        """
+        Return (inner, outer) fringe bitsets of a state. q is in the outer
+        fringe iff one of its atoms lies inside state + {q}.
+        """
+        inner = outer = 0
+        for q in _iter_bits(state):
+            rest = state & ~(1 << q)
+            if self.interior(rest) == rest:
+                inner |= 1 << q
+        for q, atoms in enumerate(self.atoms):
+            grown = state | (1 << q)
+            if grown != state and any(not a & ~grown for a in atoms):
+                outer |= 1 << q
+        return inner, outer
+
+    def iter_states(self) -> Iterator[int]:
+        """Yield every state of the space exactly once, starting with the largest."""
+        n = len(self.item_ids)
+        full = (1 << n) - 1
+
+        def close(complement: int) -> int:
+            return full & ~self.interior(full & ~complement)
+
+        closed = close(0)
+        while True:
+            yield full & ~closed
+            for i in range(n - 1, -1, -1):
+                bit = 1 << i
+                if closed & bit:
+                    continue
+                lower = closed & (bit - 1)
+                nxt = close(lower | bit)
+                if nxt & (bit - 1) == lower:
+                    closed = nxt
+                    break
+            else:
+                return
+
+    def state_base(self) -> list[dict]:
+        """Render the base as schema state_base[] entries."""
+        return [
+            {"id": f"base-{k:04d}",
+             "items": sorted(self.item_ids[j] for j in _iter_bits(b))}
+            for k, b in enumerate(self.base)
+        ]
+
+
+# ---------------------------------------------------------------------------
+# Competence-Based KST
+# ---------------------------------------------------------------------------
+
+class CompetenceStructure:
+    """
+    Derives the item (performance) structure of a graph from its
+    competence layer.
+
+    Competence states are the downsets of competence_relations, held in a
+    SurmiseIndex over the competences. The problem function is precomputed
+    per item from required_competences as a list of competence bitsets, one
+    per alternative group: a list of IDs is a single conjunctive group, an
+    array of arrays lists disjunctive alternatives, and an item without
+    requirements is solved in every state. Raises ValueError if an item
+    requires a competence ID that is not defined (dropping the requirement
+    would make the item solvable everywhere).
+    """
+
+    def __init__(self, graph: dict, index: SurmiseIndex | None = None):
+        unknown = unknown_competence_refs(graph)
+        if unknown:
+            raise ValueError(f"{len(unknown)} required competence(s) are not "
+                             f"defined: {unknown[:5]}")
+        self.index = index if index is not None else SurmiseIndex.from_graph(graph)
+        self.competences = SurmiseIndex(
+            (c["id"] for c in graph.get("competences", [])),
+            ((r["prerequisite"], r["target"])
+             for r in graph.get("competence_relations", [])))
+        items_by_id = {item["id"]: item for item in graph["items"]}
+        self.groups: list[list[int]] = []
+        for iid in self.index.item_ids:
+            required = items_by_id.get(iid, {}).get("required_competences", [])
+            if any(isinstance(r, list) for r in required):
+                groups = [self.competences.mask([r] if isinstance(r, str) else r)
+                          for r in required]
+            else:
+                groups = [self.competences.mask(required)]
+            self.groups.append(groups)
+        # competence -> [(item, group containing it)], for incremental updates
+        self.by_competence: list[list[tuple[int, int]]] = [
+            [] for _ in self.competences.item_ids]
+        for q, groups in enumerate(self.groups):
+            for g in groups:
+                for c in _iter_bits(g):
+                    self.by_competence[c].append((q, g))
+
+    def problem(self, competence_state: int) -> int:
+        """Item bitset solvable with the given competence bitset."""
+        solved = 0
+        for q, groups in enumerate(self.groups):
+            if any(not g & ~competence_state for g in groups):
+                solved |= 1 << q
+        return solved
+
+    def iter_states(self) -> Iterator[tuple[int, int]]:
+        """
+        Stream (item state, competence state) for each distinct item state,
+        paired with the first competence state that produces it.
+
+        Competence downsets are walked as in iter_downsets, with the solved
+        items carried along: adding competence x only checks the groups that
+        contain x. Item states already produced are skipped through a hash
+        set, so memory grows with the number of distinct item states only.
+        """
+        comp = self.competences
+        prereq, succ = comp.prereq_mask, comp.succ_mask
+        addable = 0
+        for i, mask in enumerate(prereq):
+            if not mask:
+                addable |= 1 << i
+        solved = self.problem(0)
+        seen = {solved}
+        yield solved, 0
+        # Frame: [competence state, addable, solved items, forbidden, untried]
+        stack = [[0, addable, solved, 0, addable]]
+        while stack:
+            frame = stack[-1]
+            candidates = frame[4]
+            if not candidates:
+                stack.pop()
+                continue
+            low = candidates & -candidates
+            state, addable, solved, forbidden = frame[0], frame[1], frame[2], frame[3]
+            frame[3] = forbidden | low
+            frame[4] = candidates ^ low
+
+            x = low.bit_length() - 1
+            child = state | low
+            child_addable = addable ^ low
+            for j in _iter_bits(succ[x]):
+                if not prereq[j] & ~child:
+                    child_addable |= 1 << j
+            child_solved = solved
+            for q, g in self.by_competence[x]:
+                if not g & ~child:
+                    child_solved |= 1 << q
+            if child_solved not in seen:
+                seen.add(child_solved)
+                yield child_solved, child
+            stack.append([child, child_addable, child_solved, forbidden,
+                          child_addable & ~forbidden])
+
+    def fringe_index(self, max_states: int | None = None) -> FringeIndex:
+        """
+        Collect the derived item states into a FringeIndex. The structure
+        need not be a downset lattice, so fringes are found by membership
+        tests against the collected family.
+        """
+        states = []
+        truncated = False
+        for state, _ in self.iter_states():
+            if max_states is not None and len(states) >= max_states:
+                print(f"WARNING: State derivation stopped at {max_states} states.",
+                      file=sys.stderr)
+                truncated = True
                 break
-            # Score and select
-            candidates.sort(key=lambda x: (-score_fn(x, current, path), x))
-            chosen = candidates[0]
-            path.append(chosen)
-            current = current | {chosen}
-        return path
+            states.append(state)
+        family = set(states)
+        full = self.index.full_mask
+        inner, outer = [], []
+        for state in states:
+            inner.append(sum(1 << q for q in _iter_bits(state)
+                             if state & ~(1 << q) in family))
+            outer.append(sum(1 << q for q in _iter_bits(full & ~state)
+                             if state | (1 << q) in family))
+        return FringeIndex(self.index, states, inner, outer, truncated)
 
-    def score_max_unlock(item, current, path):
-        """Score by how many new items this unlocks."""
-        new_state = current | {item}
-        count = 0
-        for candidate in item_ids - new_state:
-            prereqs = adj.get(candidate, set())
-            if prereqs <= new_state:
-                count += 1
-        return count
-
-    def score_depth_first(item, current, path):
-        """Score by tag overlap with most recent item."""
-        if not path:
-            return 0
-        items_by_id = {it["id"]: it for it in graph["items"]}
-        last_tags = set(items_by_id.get(path[-1], {}).get("tags", []))
-        item_tags = set(items_by_id.get(item, {}).get("tags", []))
-        return len(last_tags & item_tags)
-
-    def score_breadth_first(item, current, path):
-        """Score by inverse frequency of item's tags in path so far."""
-        items_by_id = {it["id"]: it for it in graph["items"]}
-        tag_counts = defaultdict(int)
-        for p in path:
-            for t in items_by_id.get(p, {}).get("tags", []):
+
+def unknown_competence_refs(graph: dict) -> list[tuple[str, str]]:
+    """(item ID, competence ID) for each required competence not defined."""
+    known = {c["id"] for c in graph.get("competences", [])}
+    unknown = []
+    for item in graph["items"]:
+        for req in item.get("required_competences", []):
+            for cid in [req] if isinstance(req, str) else req:
+                if cid not in known:
+                    unknown.append((item["id"], cid))
+    return unknown
+
+
+# ---------------------------------------------------------------------------
+# Learning Path Generation
+# ---------------------------------------------------------------------------
+
+class LearningPathEngine:
+    """
+    Greedy learning-path construction with per-item metadata computed once.
+
+    Precomputed: prerequisite counts, successor lists and tag bitsets per
+    item. While a path is built the engine keeps
+    - remaining[x]: number of x's direct prerequisites not yet learned,
+      so the outer fringe is updated from the successors of each chosen item;
+    - unlocks[x]: number of successors for which x is the last missing
+      prerequisite (the 'max-unlock' score), updated when a successor's
+      remaining count drops to one;
+    - a tag histogram of the path so far, updated per chosen item.
+    Each step therefore costs O(fringe + successors of the chosen item).
+    """
+
+    STRATEGIES = ("breadth-first", "depth-first", "max-unlock")
+
+    def __init__(self, graph: dict, index: SurmiseIndex | None = None):
+        self.index = index if index is not None else SurmiseIndex.from_graph(graph)
+        ids = self.index.item_ids
+        self.successors = [list(_iter_bits(m)) for m in self.index.succ_mask]
+        self.prereq_count = [_popcount(m) for m in self.index.prereq_mask]
+        tag_ids: dict[str, int] = {}
+        tags_of = {item["id"]: item.get("tags", []) for item in graph["items"]}
+        self.tags: list[list[int]] = []
+        self.tag_mask: list[int] = []
+        for iid in ids:
+            item_tags = [tag_ids.setdefault(t, len(tag_ids))
+                         for t in dict.fromkeys(tags_of.get(iid, []))]
+            self.tags.append(item_tags)
+            mask = 0
+            for t in item_tags:
+                mask |= 1 << t
+            self.tag_mask.append(mask)
+        self.n_tags = len(tag_ids)
+
+    def build(self, strategy: str, start: int = 0,
+              allowed_states: set[int] | None = None) -> list[str]:
+        """
+        Build one path from the start state (a downset bitset) until no item
+        can be added. If allowed_states is given, only steps that land in
+        that family are taken.
+        """
+        if strategy not in self.STRATEGIES:
+            raise ValueError(f"Unknown path strategy: {strategy}")
+        ids = self.index.item_ids
+        prereq = self.index.prereq_mask
+        remaining = [_popcount(m & ~start) for m in prereq]
+        unlocks = [0] * len(ids)
+        for y, m in enumerate(prereq):
+            if remaining[y] == 1 and not start >> y & 1:
+                unlocks[(m & ~start).bit_length() - 1] += 1
+        fringe = {x for x in range(len(ids))
+                  if remaining[x] == 0 and not start >> x & 1}
+        tag_counts = [0] * self.n_tags
+        current, path, last = start, [], -1
+
+        while fringe:
+            if strategy == "max-unlock":
+                score = unlocks.__getitem__
+            elif strategy == "depth-first":
+                last_tags = self.tag_mask[last] if last >= 0 else 0
+                score = lambda x: _popcount(self.tag_mask[x] & last_tags)
+            else:
+                score = lambda x: (-sum(tag_counts[t] for t in self.tags[x])
+                                   / len(self.tags[x]) if self.tags[x] else 0)
+            candidates = fringe
+            if allowed_states is not None:
+                candidates = [x for x in fringe if current | (1 << x) in allowed_states]
+                if not candidates:
+                    break
+            chosen = min(candidates, key=lambda x: (-score(x), ids[x]))
+
+            fringe.discard(chosen)
+            current |= 1 << chosen
+            path.append(ids[chosen])
+            last = chosen
+            for t in self.tags[chosen]:
                 tag_counts[t] += 1
-        item_tags = items_by_id.get(item, {}).get("tags", [])
-        if not item_tags:
-            return 0
-        return -sum(tag_counts.get(t, 0) for t in item_tags) / len(item_tags)
+            for y in self.successors[chosen]:
+                remaining[y] -= 1
+                if remaining[y] == 1:
+                    unlocks[(prereq[y] & ~current).bit_length() - 1] += 1
+                elif remaining[y] == 0 and not current >> y & 1:
+                    fringe.add(y)
+        return path
+
+
+def generate_learning_paths(
+    graph: dict,
+    all_states: list[frozenset[str]] | None = None,
+    strategy: str = "breadth-first",
+    max_paths: int = 5,
+    start: Iterable[str] | None = None,
+    index: SurmiseIndex | None = None
+) -> list[list[str]]:
+    """
+    Generate learning paths (maximal chains from empty set to Q).
+
+    Strategies:
+    - 'breadth-first': prefer items from underrepresented topics
+    - 'depth-first': prefer items continuing current topic
+    - 'max-unlock': prefer items that unlock the most new items
+
+    Paths are built by LearningPathEngine directly on the surmise relation,
+    so all_states is optional; if given, steps are restricted to that family.
+    start (e.g. a student's current_state) makes paths begin from that state
+    instead of the empty set.
+    """
+    engine = LearningPathEngine(graph, index)
+    index = engine.index
+    allowed = None
+    if all_states is not None:
+        allowed = {index.mask(state) for state in all_states}
+    if _feasible_mask(index) != index.full_mask or (
+            allowed is not None and index.full_mask not in allowed):
+        print("WARNING: Full domain is not a valid state. Paths may be partial.",
+              file=sys.stderr)
+
+    start_mask = index.mask(start) if start is not None else 0
+    paths = []
+    with profile_phase("learning_paths"):
+        for name in LearningPathEngine.STRATEGIES:
+            path = engine.build(name, start_mask, allowed)
+            profile_count("steps", len(path))
+            if path:
+                paths.append(path)
+
+    return paths[:max_paths]
+
+
+_BLOOM_ORDER = {"remember": 0, "understand": 1, "apply": 2,
+                "analyze": 3, "evaluate": 4, "create": 5}
+
+
+def _difficulty(item: dict) -> float:
+    """Rough difficulty from Bloom's level (0-5) and DOK level (1-4)."""
+    return _BLOOM_ORDER.get(item.get("bloom_level", ""), 2) + item.get("dok_level", 2)
+
+
+def topic_switch_cost(item: dict, prev: dict | None) -> float:
+    """1 when the item shares no tag with the previous item, else 0."""
+    if prev is None:
+        return 0.0
+    return 0.0 if set(item.get("tags", [])) & set(prev.get("tags", [])) else 1.0
+
+
+def difficulty_ramp_cost(item: dict, prev: dict | None) -> float:
+    """Size of the jump in difficulty from the previous item."""
+    if prev is None:
+        return 0.0
+    return abs(_difficulty(item) - _difficulty(prev))
+
+
+def estimated_time_cost(item: dict, prev: dict | None) -> float:
+    """
+    Estimated minutes: 10/20/40/60 by DOK level, plus 5 minutes of
+    context switching when the topic (tags) changes.
+    """
+    minutes = {1: 10, 2: 20, 3: 40, 4: 60}.get(item.get("dok_level", 2), 20)
+    return minutes + 5 * topic_switch_cost(item, prev)
+
+
+# name -> (cost(item, prev), lower_bound(item)); lower bounds keep A* admissible
+PATH_COSTS: dict[str, tuple[Callable[[dict, dict | None], float],
+                            Callable[[dict], float]]] = {
+    "topic-switch": (topic_switch_cost, lambda item: 0.0),
+    "difficulty-ramp": (difficulty_ramp_cost, lambda item: 0.0),
+    "estimated-time": (estimated_time_cost,
+                       lambda item: estimated_time_cost(item, None)),
+}
+
+
+def optimal_learning_paths(
+    graph: dict,
+    k: int = 3,
+    cost: str | Callable[[dict, dict | None], float] = "topic-switch",
+    lower_bound: Callable[[dict], float] | None = None,
+    start: Iterable[str] | None = None,
+    goal: Iterable[str] | None = None,
+    max_expansions: int = 1_000_000,
+    index: SurmiseIndex | None = None
+) -> list[tuple[float, list[str]]]:
+    """
+    Find the k cheapest learning paths through the downset lattice.
+
+    A path adds one outer-fringe item at a time, from start (e.g. a
+    student's current_state; default the empty state) until the goal is
+    reached: the downward closure of the goal items (default: every
+    learnable item). Only items of that goal state are ever added.
+
+    cost(item, prev) prices each step given the previous item (None for the
+    first step); a name from PATH_COSTS selects a built-in cost and its
+    lower bound. The search is A* over labels (state bitset, last item),
+    memoized by state bitset and last item, with h = sum of lower_bound over
+    the items still to learn (admissible, since every one of them must be
+    added). Each label may be settled up to k times, which yields the k best
+    paths of the lattice DAG in order. States are generated on the fly; the
+    lattice is never enumerated.
+
+    Returns [(total_cost, [item IDs in order]), ...], cheapest first. Stops
+    with a warning after max_expansions labels.
+    """
+    if index is None:
+        index = SurmiseIndex.from_graph(graph)
+    if isinstance(cost, str):
+        cost, default_bound = PATH_COSTS[cost]
+        lower_bound = lower_bound or default_bound
+    items_by_id = {item["id"]: item for item in graph["items"]}
+    items = [items_by_id[iid] for iid in index.item_ids]
+    bound = [lower_bound(item) if lower_bound else 0.0 for item in items]
+    prereq, succ = index.prereq_mask, index.succ_mask
+
+    start_mask = index.mask(start) if start is not None else 0
+    target = start_mask | _feasible_mask(index)
+    if goal is not None:
+        target = start_mask
+        for j in _iter_bits(index.mask(goal) & _feasible_mask(index)):
+            target |= (1 << j) | index.ancestors[j]
+    h_total = sum(bound[j] for j in _iter_bits(target & ~start_mask))
+
+    addable = 0
+    for j in _iter_bits(target & ~start_mask):
+        if not prereq[j] & ~start_mask:
+            addable |= 1 << j
+
+    # label: (f, -depth, tiebreak, g, learned_bound, state, addable, last, trail)
+    # trail is a linked list (item, parent_trail) shared between labels.
+    counter = 0
+    heap = [(h_total, 0, counter, 0.0, 0.0, start_mask, addable, -1, None)]
+    settled: dict[tuple[int, int], int] = defaultdict(int)
+    results: list[tuple[float, list[str]]] = []
+    expansions = 0
+    with profile_phase("optimal_paths"):
+        while heap and len(results) < k:
+            f, neg_depth, _, g, learned, state, addable, last, trail = heapq.heappop(heap)
+            key = (state, last)
+            if settled[key] >= k:
+                continue
+            settled[key] += 1
+            if state == target:
+                path = []
+                while trail is not None:
+                    path.append(index.item_ids[trail[0]])
+                    trail = trail[1]
+                results.append((g, path[::-1]))
+                continue
+            expansions += 1
+            if expansions > max_expansions:
+                print(f"WARNING: Path search stopped after {max_expansions} expansions.",
+                      file=sys.stderr)
+                break
+            prev = items[last] if last >= 0 else None
+            for x in _iter_bits(addable):
+                child = state | (1 << x)
+                child_addable = addable ^ (1 << x)
+                for y in _iter_bits(succ[x] & target):
+                    if not prereq[y] & ~child:
+                        child_addable |= 1 << y
+                child_g = g + cost(items[x], prev)
+                child_learned = learned + bound[x]
+                counter += 1
+                heapq.heappush(heap, (child_g + h_total - child_learned, neg_depth - 1,
+                                      counter, child_g, child_learned, child,
+                                      child_addable, x, (x, trail)))
+        profile_count("labels_expanded", expansions)
+        profile_count("labels_pushed", counter)
+    return results
+
+
+# ---------------------------------------------------------------------------
+# BLIM — Bayesian Assessment
+# ---------------------------------------------------------------------------
+
+def blim_update(
+    state_probs: dict[str, float],
+    states: dict[str, set[str]],
+    item_id: str,
+    response_correct: bool,
+    lucky_guess: float = 0.1,
+    careless_error: float = 0.1
+) -> dict[str, float]:
+    """
+    Bayesian update of knowledge state probabilities given a response.
+
+    Parameters:
+    - state_probs: {state_id: probability} current distribution
+    - states: {state_id: set of item IDs in that state}
+    - item_id: which item was assessed
+    - response_correct: whether the student answered correctly
+    - lucky_guess (g): P(correct | not mastered)
+    - careless_error (s): P(incorrect | mastered)
+
+    Returns updated state probabilities (normalized).
+    """
+    updated = {}
+    for sid, prob in state_probs.items():
+        item_in_state = item_id in states[sid]
+        if response_correct:
+            likelihood = (1 - careless_error) if item_in_state else lucky_guess
+        else:
+            likelihood = careless_error if item_in_state else (1 - lucky_guess)
+        updated[sid] = prob * likelihood
+
+    # Normalize
+    total = sum(updated.values())
+    if total > 0:
+        for sid in updated:
+            updated[sid] /= total
+    return updated
+
+
+def select_assessment_item(
+    state_probs: dict[str, float],
+    states: dict[str, set[str]],
+    assessed_items: set[str],
+    all_item_ids: set[str],
+    strategy: str = "half-split",
+    item_params: dict[str, tuple[float, float]] | None = None
+) -> str | None:
+    """
+    Select the next item to assess for maximum information gain.
+
+    Strategies:
+    - 'half-split': choose the item where ~50% of probability mass has it
+      mastered and ~50% doesn't (maximum discrimination).
+    - 'entropy': choose the item minimizing the expected posterior entropy,
+      using per-item (lucky_guess, careless_error) from item_params
+      (see item_blim_parameters; 0.1/0.1 for missing items).
+    """
+    if strategy == "entropy":
+        marginals: dict[str, float] = defaultdict(float)
+        for sid, prob in state_probs.items():
+            for item_id in states[sid]:
+                marginals[item_id] += prob
+        params = item_params or {}
+        best_item, best_gain = None, -1.0
+        for item_id in sorted(all_item_ids - assessed_items):
+            g, s = params.get(item_id, (0.1, 0.1))
+            gain = _information_gain(marginals.get(item_id, 0.0), g, s)
+            if gain > best_gain:
+                best_item, best_gain = item_id, gain
+        return best_item
+    if strategy != "half-split":
+        raise ValueError(f"Unknown selection strategy: {strategy}")
+
+    best_item = None
+    best_score = float("inf")  # Closest to 0.5
+
+    for item_id in all_item_ids - assessed_items:
+        prob_mastered = sum(
+            prob for sid, prob in state_probs.items()
+            if item_id in states[sid]
+        )
+        # Score = distance from 0.5 (lower is better)
+        score = abs(prob_mastered - 0.5)
+        if score < best_score:
+            best_score = score
+            best_item = item_id
+
+    return best_item
+
+
+def _binary_entropy(p: float) -> float:
+    if p <= 0.0 or p >= 1.0:
+        return 0.0
+    return -p * math.log2(p) - (1 - p) * math.log2(1 - p)
+
+
+def _information_gain(mastery: float, lucky_guess: float,
+                      careless_error: float) -> float:
+    """
+    Expected entropy reduction from asking an item, i.e. the mutual
+    information between the state and the response:
+
+        I = h(P(correct)) - [m * h(careless_error) + (1 - m) * h(lucky_guess)]
+
+    where m is the item's mastery marginal and h the binary entropy. The
+    expected posterior entropy is entropy() minus this value, so only the
+    marginals are needed to rank items.
+    """
+    p_correct = mastery * (1 - careless_error) + (1 - mastery) * lucky_guess
+    return (_binary_entropy(p_correct)
+            - mastery * _binary_entropy(careless_error)
+            - (1 - mastery) * _binary_entropy(lucky_guess))
+
+
+def item_blim_parameters(
+    graph: dict,
+    lucky_guess: float = 0.1,
+    careless_error: float = 0.1
+) -> dict[str, tuple[float, float]]:
+    """
+    Per-item (lucky_guess, careless_error) rates from items[].blim_parameters,
+    falling back to the given defaults.
+    """
+    params = {}
+    for item in graph["items"]:
+        fitted = item.get("blim_parameters", {})
+        params[item["id"]] = (fitted.get("lucky_guess", lucky_guess),
+                              fitted.get("careless_error", careless_error))
+    return params
+
+
+def entropy(probs: dict[str, float]) -> float:
+    """Compute Shannon entropy of a probability distribution."""
+    return -sum(p * math.log2(p) for p in probs.values() if p > 0)
+
+
+def _per_item(rate: float | dict[str, float], item_ids: list[str]) -> list[float]:
+    if isinstance(rate, dict):
+        return [rate.get(iid, 0.1) for iid in item_ids]
+    return [rate] * len(item_ids)
+
+
+class BlimModel:
+    """
+    Array-backed BLIM over a fixed family of knowledge states.
+
+    The state x item incidence is stored item-major: one 0/1 membership
+    vector over states per item (rows of a NumPy float32 matrix, or bytes
+    objects without NumPy). The distribution is a float vector aligned with
+    the states (NumPy float64, or array('d')). Each operation is a single
+    batched pass over that vector:
+
+    - update: multiply by the likelihood selected through the item's row
+    - marginals: one matrix-vector product (NumPy) or one C-level
+      compress-and-sum per item (array fallback)
+    - normalize: one scaling pass
+
+    lucky_guess and careless_error may be scalars or {item_id: rate}
+    mappings (items not listed use 0.1). States are bitsets over item_ids,
+    as produced by iter_downsets. prior defaults to uniform.
+    """
+
+    def __init__(
+        self,
+        item_ids: list[str],
+        states: list[int],
+        state_ids: list[str] | None = None,
+        lucky_guess: float | dict[str, float] = 0.1,
+        careless_error: float | dict[str, float] = 0.1,
+        use_numpy: bool | None = None,
+        prior: list[float] | None = None
+    ):
+        self.item_ids = list(item_ids)
+        self.item_index = {iid: j for j, iid in enumerate(self.item_ids)}
+        self.states = list(states)
+        self.state_ids = (list(state_ids) if state_ids is not None
+                          else [f"state-{i:04d}" for i in range(len(self.states))])
+        self.lucky_guess = _per_item(lucky_guess, self.item_ids)
+        self.careless_error = _per_item(careless_error, self.item_ids)
+        self.use_numpy = np is not None if use_numpy is None else use_numpy
+        if self.use_numpy and np is None:
+            raise ImportError("use_numpy=True requires NumPy")
+
+        n_items, n_states = len(self.item_ids), len(self.states)
+        if self.use_numpy:
+            width = max((n_items + 7) // 8, 1)
+            packed = np.frombuffer(
+                b"".join(m.to_bytes(width, "little") for m in self.states),
+                dtype=np.uint8).reshape(n_states, width)
+            bits = np.unpackbits(packed, axis=1, bitorder="little")[:, :n_items]
+            self.incidence = np.ascontiguousarray(bits.T, dtype=np.float32)
+        else:
+            columns = [bytearray(n_states) for _ in range(n_items)]
+            for row, mask in enumerate(self.states):
+                for j in _iter_bits(mask):
+                    columns[j][row] = 1
+            self.incidence = [bytes(c) for c in columns]
+        self.prior = prior
+        self.reset()
+
+    @classmethod
+    def from_graph(
+        cls,
+        graph: dict,
+        index: SurmiseIndex | None = None,
+        lucky_guess: float = 0.1,
+        careless_error: float = 0.1,
+        use_numpy: bool | None = None
+    ) -> "BlimModel":
+        """
+        Build a model over graph["knowledge_states"] if present, otherwise
+        over the states regenerated from graph["state_base"], otherwise over
+        the enumerated downsets of the surmise relation. Per-item
+        rates come from items[].blim_parameters, with the given defaults,
+        and the prior from knowledge_states[].prior_probability when every
+        state has one.
+        """
+        params = item_blim_parameters(graph, lucky_guess, careless_error)
+        lucky_guess = {iid: g for iid, (g, _) in params.items()}
+        careless_error = {iid: s for iid, (_, s) in params.items()}
+        if index is None:
+            index = SurmiseIndex.from_graph(graph)
+        ks = graph.get("knowledge_states", [])
+        prior = None
+        if isinstance(ks, StateTable):
+            states = ks.masks(index.item_ids)
+            state_ids = ks.state_ids()
+            prior = ks.prior
+        elif ks:
+            states = [index.mask(s["items"]) for s in ks]
+            state_ids = [s["id"] for s in ks]
+            if all("prior_probability" in s for s in ks):
+                prior = [s["prior_probability"] for s in ks]
+        elif graph.get("state_base"):
+            states = list(KnowledgeBase.from_graph(graph, index).iter_states())
+            state_ids = None
+        else:
+            states = list(iter_downsets(graph, index))
+            state_ids = None
+        return cls(index.item_ids, states, state_ids,
+                   lucky_guess, careless_error, use_numpy, prior)
+
+    def __len__(self) -> int:
+        return len(self.states)
+
+    def reset(self) -> None:
+        """Reset to the prior (uniform unless given) over states."""
+        n = len(self.states)
+        if self.prior is not None:
+            self.probs = (np.asarray(self.prior, dtype=np.float64) if self.use_numpy
+                          else array("d", self.prior))
+            self.normalize()
+            return
+        p = 1.0 / n if n else 0.0
+        if self.use_numpy:
+            self.probs = np.full(n, p)
+        else:
+            self.probs = array("d", [p]) * n
+
+    def likelihoods(self, item_id: str, response_correct: bool) -> tuple[float, float]:
+        """Return (P(response | item not mastered), P(response | mastered))."""
+        j = self.item_index[item_id]
+        g, s = self.lucky_guess[j], self.careless_error[j]
+        return (g, 1 - s) if response_correct else (1 - g, s)
+
+    def update(self, item_id: str, response_correct: bool) -> None:
+        """Bayesian update for one response, followed by normalization."""
+        self.probs = self._posterior(self.probs, item_id, response_correct)
+
+    def normalize(self) -> None:
+        """Rescale the distribution to sum to one (no-op if all zero)."""
+        self.probs = self._normalized(self.probs)
+
+    def marginals(self) -> list[float]:
+        """P(item mastered) for every item, aligned with item_ids."""
+        return self._marginals(self.probs)
+
+    def entropy(self) -> float:
+        """Shannon entropy (bits) of the current distribution."""
+        if self.use_numpy:
+            p = self.probs[self.probs > 0]
+            return float(-(p * np.log2(p)).sum())
+        return -sum(p * math.log2(p) for p in self.probs if p > 0)
+
+    def select_item(
+        self,
+        assessed_items: set[str],
+        strategy: str = "entropy",
+        lookahead: int = 0
+    ) -> str | None:
+        """
+        Choose the next item to assess.
+
+        Strategies:
+        - 'entropy': minimize the expected posterior entropy, scored in one
+          pass over the marginals with each item's guess/slip rates. With
+          lookahead=B > 0, the B best one-step items are re-ranked by the
+          expected entropy after the best follow-up question (two-step
+          selection; costs 2B extra marginal passes).
+        - 'half-split': mastery probability closest to 0.5.
+        """
+        marginals = self.marginals()
+        if strategy == "half-split":
+            best_item, best_score = None, float("inf")
+            for j, m in enumerate(marginals):
+                item_id = self.item_ids[j]
+                if item_id in assessed_items:
+                    continue
+                score = abs(m - 0.5)
+                if score < best_score:
+                    best_item, best_score = item_id, score
+            return best_item
+        if strategy != "entropy":
+            raise ValueError(f"Unknown selection strategy: {strategy}")
+
+        gains = self._gains(marginals, assessed_items)
+        if not gains:
+            return None
+        ranked = sorted(gains, key=lambda j: -gains[j])
+        if lookahead <= 0 or len(ranked) == 1:
+            return self.item_ids[ranked[0]]
+
+        best_item, best_total = None, -1.0
+        for j in ranked[:lookahead]:
+            item_id = self.item_ids[j]
+            m, g, s = marginals[j], self.lucky_guess[j], self.careless_error[j]
+            follow_up = 0.0
+            for correct, p_response in ((True, m * (1 - s) + (1 - m) * g),
+                                        (False, m * s + (1 - m) * (1 - g))):
+                if p_response <= 0:
+                    continue
+                post = self._posterior(self.probs, item_id, correct)
+                next_gains = self._gains(self._marginals(post),
+                                         assessed_items | {item_id})
+                follow_up += p_response * max(next_gains.values(), default=0.0)
+            total = gains[j] + follow_up
+            if total > best_total:
+                best_item, best_total = item_id, total
+        return best_item
+
+    def _gains(self, marginals: list[float],
+               assessed_items: set[str]) -> dict[int, float]:
+        return {
+            j: _information_gain(m, self.lucky_guess[j], self.careless_error[j])
+            for j, m in enumerate(marginals)
+            if self.item_ids[j] not in assessed_items
+        }
+
+    def _posterior(self, probs, item_id: str, response_correct: bool):
+        j = self.item_index[item_id]
+        l_out, l_in = self.likelihoods(item_id, response_correct)
+        if self.use_numpy:
+            post = probs * np.where(self.incidence[j] > 0, l_in, l_out)
+        else:
+            factors = (l_out, l_in)
+            post = array("d", map(mul, probs,
+                                  map(factors.__getitem__, self.incidence[j])))
+        return self._normalized(post)
+
+    def _normalized(self, probs):
+        total = float(probs.sum()) if self.use_numpy else math.fsum(probs)
+        if total <= 0:
+            return probs
+        if self.use_numpy:
+            return probs / total
+        return array("d", map((1.0 / total).__mul__, probs))
+
+    def _marginals(self, probs) -> list[float]:
+        if self.use_numpy:
+            return (self.incidence @ probs.astype(np.float32)).tolist()
+        return [sum(compress(probs, col)) for col in self.incidence]
+
+    def distribution(self) -> dict[str, float]:
+        """Return the distribution as {state_id: probability}."""
+        return dict(zip(self.state_ids, map(float, self.probs)))
+
+    def most_likely_state(self) -> tuple[str, list[str]]:
+        """Return (state_id, item IDs) of the modal state."""
+        row = (int(self.probs.argmax()) if self.use_numpy
+               else max(range(len(self.probs)), key=self.probs.__getitem__))
+        return self.state_ids[row], self.ids_of(row)
+
+    def ids_of(self, row: int) -> list[str]:
+        """Item IDs of the state in the given row."""
+        return [self.item_ids[j] for j in _iter_bits(self.states[row])]
+
+
+class AssessmentSessionPool:
+    """
+    Many concurrent assessments over one shared, immutable BlimModel.
+
+    The model's incidence, item parameters and prior are shared; each
+    session owns only its posterior vector and a bitset of asked items.
+    With NumPy the posteriors are rows of one (capacity x states) matrix
+    (precision 'd' = float64 or 'f' = float32), and a batch of
+    (session_id, item_id, correct) events is applied as a few vectorized
+    row updates. Without NumPy each session holds one array('d'/'f') and
+    events are applied one by one through the model.
+    """
+
+    def __init__(self, model: BlimModel, precision: str = "d",
+                 chunk_size: int = 256):
+        if precision not in ("d", "f"):
+            raise ValueError("precision must be 'd' (float64) or 'f' (float32)")
+        self.model = model
+        self.precision = precision
+        self.chunk_size = chunk_size
+        self.prior = model.probs
+        self.asked: dict[str, int] = {}
+        self._rows: dict[str, int] = {}
+        self._free: list[int] = []
+        if model.use_numpy:
+            self._dtype = np.float64 if precision == "d" else np.float32
+            self._probs = np.empty((0, len(model)), dtype=self._dtype)
+            self._guess = np.asarray(model.lucky_guess)
+            self._slip = np.asarray(model.careless_error)
+        else:
+            self._probs = []
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def __contains__(self, session_id: str) -> bool:
+        return session_id in self._rows
+
+    def open(self, session_id: str) -> None:
+        """Start a session at the model's prior distribution."""
+        if session_id in self._rows:
+            raise ValueError(f"Session already open: {session_id}")
+        if not self._free:
+            self._grow()
+        row = self._free.pop()
+        self._probs[row] = (self.prior if self.model.use_numpy
+                            else array(self.precision, self.prior))
+        self._rows[session_id] = row
+        self.asked[session_id] = 0
+
+    def close(self, session_id: str) -> None:
+        """End a session and recycle its posterior row."""
+        row = self._rows.pop(session_id)
+        del self.asked[session_id]
+        self._free.append(row)
+
+    def process(self, events: Iterable[tuple[str, str, bool]]) -> None:
+        """
+        Apply a batch of (session_id, item_id, response_correct) events.
+
+        Events for the same session are applied in order; the batch is split
+        into rounds in which every session appears at most once.
+        """
+        item_index = self.model.item_index
+        pending = list(events)
+        while pending:
+            batch, later, seen = [], [], set()
+            for event in pending:
+                (later if event[0] in seen else batch).append(event)
+                seen.add(event[0])
+            for start in range(0, len(batch), self.chunk_size):
+                self._apply(batch[start:start + self.chunk_size])
+            for sid, item_id, _ in batch:
+                self.asked[sid] |= 1 << item_index[item_id]
+            pending = later
+
+    def _apply(self, chunk: list[tuple[str, str, bool]]) -> None:
+        model = self.model
+        if not model.use_numpy:
+            for sid, item_id, correct in chunk:
+                row = self._rows[sid]
+                post = model._posterior(self._probs[row], item_id, correct)
+                self._probs[row] = (post if self.precision == "d"
+                                    else array("f", post))
+            return
+        n = len(chunk)
+        rows = np.fromiter((self._rows[e[0]] for e in chunk), np.intp, n)
+        items = np.fromiter((model.item_index[e[1]] for e in chunk), np.intp, n)
+        correct = np.fromiter((bool(e[2]) for e in chunk), bool, n)
+        g, s = self._guess[items], self._slip[items]
+        l_in = np.where(correct, 1 - s, s)[:, None]
+        l_out = np.where(correct, g, 1 - g)[:, None]
+        post = self._probs[rows] * np.where(model.incidence[items] > 0, l_in, l_out)
+        totals = post.sum(axis=1, keepdims=True)
+        totals[totals <= 0] = 1.0
+        self._probs[rows] = post / totals
+
+    def marginals(self, session_id: str) -> list[float]:
+        """P(item mastered) for every model item in one session."""
+        return self.model._marginals(self._probs[self._rows[session_id]])
+
+    def entropies(self, session_ids: list[str]) -> list[float]:
+        """Posterior entropy (bits) of each listed session."""
+        if not self.model.use_numpy:
+            return [-sum(p * math.log2(p) for p in self._probs[self._rows[sid]] if p > 0)
+                    for sid in session_ids]
+        rows = [self._rows[sid] for sid in session_ids]
+        p = self._probs[rows].astype(np.float64)
+        logs = np.log2(p, out=np.zeros_like(p), where=p > 0)
+        return (-(p * logs).sum(axis=1)).tolist()
+
+    def next_items(self, session_ids: list[str]) -> dict[str, str | None]:
+        """
+        Expected-entropy item selection (see BlimModel.select_item) for a
+        batch of sessions, skipping items each session was already asked.
+        """
+        model = self.model
+        if not model.use_numpy:
+            chosen = {}
+            for sid in session_ids:
+                asked = set(model.item_ids[j] for j in _iter_bits(self.asked[sid]))
+                gains = model._gains(self.marginals(sid), asked)
+                chosen[sid] = (model.item_ids[max(gains, key=gains.__getitem__)]
+                               if gains else None)
+            return chosen
+        if not session_ids:
+            return {}
+        rows = [self._rows[sid] for sid in session_ids]
+        marg = self._probs[rows].astype(np.float32) @ model.incidence.T
+        marg = marg.astype(np.float64)
+        gains = (_binary_entropy_array(marg * (1 - self._slip) + (1 - marg) * self._guess)
+                 - marg * _binary_entropy_array(self._slip)
+                 - (1 - marg) * _binary_entropy_array(self._guess))
+        n_items = len(model.item_ids)
+        width = max((n_items + 7) // 8, 1)
+        asked = np.unpackbits(
+            np.frombuffer(b"".join(self.asked[sid].to_bytes(width, "little")
+                                   for sid in session_ids), dtype=np.uint8)
+            .reshape(len(session_ids), width),
+            axis=1, bitorder="little")[:, :n_items].astype(bool)
+        gains[asked] = -np.inf
+        best = gains.argmax(axis=1)
+        exhausted = asked.all(axis=1)
+        return {sid: None if exhausted[k] else model.item_ids[best[k]]
+                for k, sid in enumerate(session_ids)}
+
+    def posterior(self, session_id: str) -> dict[str, float]:
+        """Return one session's distribution as {state_id: probability}."""
+        return dict(zip(self.model.state_ids,
+                        map(float, self._probs[self._rows[session_id]])))
+
+    def most_likely_state(self, session_id: str) -> tuple[str, list[str]]:
+        """Return (state_id, item IDs) of a session's modal state."""
+        probs = self._probs[self._rows[session_id]]
+        row = (int(probs.argmax()) if self.model.use_numpy
+               else max(range(len(probs)), key=probs.__getitem__))
+        return self.model.state_ids[row], self.model.ids_of(row)
+
+    def _grow(self) -> None:
+        old = len(self._probs)
+        new = max(16, 2 * old)
+        if self.model.use_numpy:
+            grown = np.empty((new, len(self.model)), dtype=self._dtype)
+            grown[:old] = self._probs
+            self._probs = grown
+        else:
+            self._probs.extend([None] * (new - old))
+        self._free.extend(range(new - 1, old - 1, -1))
+
+
+def _binary_entropy_array(p):
+    """Elementwise binary entropy of a NumPy array."""
+    q = 1 - p
+    with np.errstate(divide="ignore", invalid="ignore"):
+        h = -(p * np.log2(p) + q * np.log2(q))
+    return np.nan_to_num(h)
+
+
+class SparseBlimPosterior:
+    """
+    BLIM posterior kept on a pruned support of states, for state spaces
+    whose full state list does not fit in memory.
+
+    The support maps state bitsets to weights proportional to the posterior
+    under a uniform prior. After each response:
+
+    - weights are multiplied by the response likelihood;
+    - if the response was surprising (its predicted probability under the
+      current support was below expand_below), fringe neighbours of the
+      heaviest states (one outer-fringe item added or one inner-fringe item
+      removed) are brought (back) into the support, weighted exactly by
+      replaying the response history;
+    - states below threshold (and, with top_k, outside the top_k) are
+      dropped and the rest renormalized. The dropped mass is accumulated
+      into discarded_mass, an estimate of the posterior mass outside the
+      support (it also starts with the prior mass of states never
+      sampled into the initial support). Ties at the top_k cut keep the
+      states with the smaller bitset, so pruning is deterministic.
+
+    The initial support is the whole space when it has at most max_support
+    states, otherwise max_support uniformly sampled states plus the empty
+    and full states. It is not pruned before the first response: under the
+    uniform prior every state ties, and a cut would depend only on
+    enumeration order.
+    """
+
+    def __init__(
+        self,
+        index: SurmiseIndex,
+        lucky_guess: float | dict[str, float] = 0.1,
+        careless_error: float | dict[str, float] = 0.1,
+        threshold: float = 1e-6,
+        top_k: int | None = None,
+        max_support: int = 100000,
+        expand_below: float = 0.5,
+        expand_limit: int = 64,
+        initial_states: Iterable[int] | None = None,
+        seed: int | None = None
+    ):
+        self.index = index
+        self.lucky_guess = _per_item(lucky_guess, index.item_ids)
+        self.careless_error = _per_item(careless_error, index.item_ids)
+        self.threshold = threshold
+        self.top_k = top_k
+        self.expand_below = expand_below
+        self.expand_limit = expand_limit
+        self.feasible = _feasible_mask(index)
+        self.responses: list[tuple[int, bool]] = []
+        self.discarded_mass = 0.0
+        self._log_scale = 0.0
+
+        if initial_states is None:
+            initial_states = []
+            for state, _, _ in _walk_downsets(index):
+                initial_states.append(state)
+                if len(initial_states) > max_support:
+                    break
+            if len(initial_states) > max_support:
+                counter = _DownsetCounter(index)
+                total = counter.count(self.feasible)
+                rng = random.Random(seed)
+                initial_states = {counter.sample(self.feasible, rng)
+                                  for _ in range(max_support)}
+                initial_states |= {0, self.feasible}
+                self.discarded_mass = 1 - len(initial_states) / total
+        self.support: dict[int, float] = dict.fromkeys(initial_states, 1.0)
+
+    @classmethod
+    def from_graph(cls, graph: dict, index: SurmiseIndex | None = None,
+                   **kwargs) -> "SparseBlimPosterior":
+        """Build over the graph's downset lattice with per-item rates."""
+        if index is None:
+            index = SurmiseIndex.from_graph(graph)
+        params = item_blim_parameters(graph)
+        kwargs.setdefault("lucky_guess", {i: g for i, (g, _) in params.items()})
+        kwargs.setdefault("careless_error", {i: s for i, (_, s) in params.items()})
+        return cls(index, **kwargs)
+
+    def __len__(self) -> int:
+        return len(self.support)
+
+    def _likelihood(self, j: int, correct: bool, state: int) -> float:
+        g, s = self.lucky_guess[j], self.careless_error[j]
+        if state >> j & 1:
+            return 1 - s if correct else s
+        return g if correct else 1 - g
+
+    def update(self, item_id: str, response_correct: bool) -> None:
+        """Condition on one response, expanding and pruning the support."""
+        j = self.index.index[item_id]
+        self.responses.append((j, response_correct))
+        total = sum(self.support.values())
+        predicted = 0.0
+        for state, w in self.support.items():
+            lik = self._likelihood(j, response_correct, state)
+            predicted += w * lik
+            self.support[state] = w * lik
+        if total > 0 and predicted / total < self.expand_below:
+            self.expand()
+        self._prune()
+
+    def expand(self) -> int:
+        """
+        Add the fringe neighbours of the heaviest states to the support.
+        Returns the number of states added.
+        """
+        prereq, succ = self.index.prereq_mask, self.index.succ_mask
+        heaviest = sorted(self.support, key=self.support.__getitem__,
+                          reverse=True)[:self.expand_limit]
+        added = 0
+        for state in heaviest:
+            neighbours = []
+            for x in _iter_bits(self.feasible & ~state):
+                if not prereq[x] & ~state:
+                    neighbours.append(state | (1 << x))
+            for x in _iter_bits(state):
+                if not succ[x] & state:
+                    neighbours.append(state & ~(1 << x))
+            for nb in neighbours:
+                if nb not in self.support:
+                    self.support[nb] = self._replay(nb)
+                    added += 1
+        return added
+
+    def _replay(self, state: int) -> float:
+        log_w = -self._log_scale
+        for j, correct in self.responses:
+            log_w += math.log(self._likelihood(j, correct, state))
+        return math.exp(log_w)
+
+    def _prune(self) -> None:
+        total = sum(self.support.values())
+        if total <= 0:
+            return
+        keep = {st: w for st, w in self.support.items() if w / total >= self.threshold}
+        if self.top_k is not None and len(keep) > self.top_k:
+            ranked = sorted(keep.items(), key=lambda kv: (-kv[1], kv[0]))
+            keep = dict(ranked[:self.top_k])
+        if not keep:
+            # A flat posterior can leave every state under the threshold;
+            # keep the heaviest one and count the rest as discarded.
+            heaviest = min(self.support, key=lambda st: (-self.support[st], st))
+            keep = {heaviest: self.support[heaviest]}
+        kept = sum(keep.values())
+        dropped = 1 - kept / total
+        self.discarded_mass = 1 - (1 - self.discarded_mass) * (1 - dropped)
+        # Rescale so the heaviest state has weight 1; remember the factor so
+        # replayed states stay on the same scale.
+        peak = max(keep.values())
+        self._log_scale += math.log(peak)
+        self.support = {st: w / peak for st, w in keep.items()}
+
+    def probabilities(self) -> dict[int, float]:
+        """Normalized posterior over the support, keyed by state bitset."""
+        total = sum(self.support.values())
+        return {st: w / total for st, w in self.support.items()}
+
+    def marginals(self) -> list[float]:
+        """P(item mastered) for every item, aligned with index.item_ids."""
+        marg = [0.0] * len(self.index)
+        for state, p in self.probabilities().items():
+            for j in _iter_bits(state):
+                marg[j] += p
+        return marg
+
+    def entropy(self) -> float:
+        """Shannon entropy (bits) of the normalized support distribution."""
+        return -sum(p * math.log2(p) for p in self.probabilities().values() if p > 0)
+
+    def select_item(self, assessed_items: set[str]) -> str | None:
+        """Expected-entropy item selection (see BlimModel.select_item)."""
+        best_item, best_gain = None, -1.0
+        for j, m in enumerate(self.marginals()):
+            item_id = self.index.item_ids[j]
+            if item_id in assessed_items:
+                continue
+            gain = _information_gain(m, self.lucky_guess[j], self.careless_error[j])
+            if gain > best_gain:
+                best_item, best_gain = item_id, gain
+        return best_item
+
+    def most_likely_state(self) -> list[str]:
+        """Item IDs of the heaviest state in the support."""
+        return self.index.ids(max(self.support, key=self.support.__getitem__))
+
+
+# ---------------------------------------------------------------------------
+# BLIM — Parameter Estimation
+# ---------------------------------------------------------------------------
+
+def iter_response_patterns(graph: dict) -> Iterator[tuple[str, list[tuple[str, bool]]]]:
+    """
+    Yield (student_id, [(item_id, correct), ...]) from every student's
+    assessment_log. 'partial' and 'skipped' responses are ignored.
+    """
+    for sid, sdata in graph.get("student_states", {}).items():
+        pattern = [(entry["item_id"], entry["response"] == "correct")
+                   for entry in sdata.get("assessment_log", [])
+                   if entry.get("response") in ("correct", "incorrect")]
+        if pattern:
+            yield sid, pattern
+
+
+def fit_blim(
+    graph: dict,
+    patterns: Callable[[], Iterable[tuple[str, list[tuple[str, bool]]]]] | None = None,
+    max_iter: int = 100,
+    tol: float = 1e-4,
+    chunk_size: int = 256,
+    workers: int | None = None,
+    min_rate: float = 0.001,
+    max_rate: float = 0.5,
+    apply: bool = True,
+    use_numpy: bool | None = None
+) -> dict[str, Any]:
+    """
+    Fit per-item lucky_guess / careless_error rates and the state prior of
+    the BLIM by expectation-maximization over logged responses.
+
+    patterns is a zero-argument callable returning a fresh iterable of
+    (student_id, [(item_id, correct), ...]); it is called once per EM
+    iteration, so logs can be streamed from disk instead of held in memory.
+    It defaults to iter_response_patterns(graph).
+
+    Students are processed in chunks of chunk_size; each chunk's E-step is
+    one batched pass over the state space (a matrix product with NumPy) and
+    returns sufficient statistics only. With workers > 1 chunks are farmed
+    out to a process pool. Rates are clamped to [min_rate, max_rate].
+
+    If apply is true, the fitted rates are written to items[].blim_parameters
+    and, when knowledge_states are stored, the prior to their
+    prior_probability. Returns the fitted rates, prior, final
+    log-likelihood and convergence information.
+    """
+    if patterns is None:
+        patterns = lambda: iter_response_patterns(graph)
+    model = BlimModel.from_graph(graph, use_numpy=use_numpy)
+    n_items = len(model.item_ids)
+    prior = [1.0 / len(model)] * len(model)
+    guess = [min(max(g, min_rate), max_rate) for g in model.lucky_guess]
+    slip = [min(max(s, min_rate), max_rate) for s in model.careless_error]
+
+    pool = (ProcessPoolExecutor(workers, initializer=_em_worker_init,
+                                initargs=(model.item_ids, model.states, model.use_numpy))
+            if workers and workers > 1 else None)
+    log_lik, converged, iteration = float("-inf"), False, 0
+    try:
+        for iteration in range(1, max_iter + 1):
+            totals = _EmStats(len(model), n_items)
+            with profile_phase("fit_blim.e_step"):
+                chunks = (_encode_patterns(model, chunk)
+                          for chunk in _chunked(patterns(), chunk_size))
+                if pool is None:
+                    for chunk in chunks:
+                        totals.merge(_em_chunk_stats(model, prior, guess, slip, chunk))
+                else:
+                    # At most 2 chunks per worker are encoded and queued at a
+                    # time, so memory stays flat however many patterns stream in.
+                    pending = set()
+                    for chunk in chunks:
+                        if len(pending) >= 2 * workers:
+                            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                            for future in done:
+                                totals.merge(future.result())
+                        pending.add(pool.submit(_em_worker_stats, prior, guess, slip, chunk))
+                    for future in as_completed(pending):
+                        totals.merge(future.result())
+                profile_count("students", totals.n_students)
+                profile_count("states", len(model))
+            if not totals.n_students:
+                break
+
+            prior = [w / totals.n_students for w in totals.prior]
+            for j in range(n_items):
+                if totals.in_total[j] > 0:
+                    s = 1 - totals.in_correct[j] / totals.in_total[j]
+                    slip[j] = min(max(s, min_rate), max_rate)
+                if totals.out_total[j] > 0:
+                    g = totals.out_correct[j] / totals.out_total[j]
+                    guess[j] = min(max(g, min_rate), max_rate)
+            improved = totals.log_lik - log_lik
+            log_lik = totals.log_lik
+            if abs(improved) < tol * max(1.0, abs(log_lik)):
+                converged = True
+                break
+    finally:
+        if pool is not None:
+            pool.shutdown()
 
-    scorers = {
-        "breadth-first": score_breadth_first,
-        "depth-first": score_depth_first,
-        "max-unlock": score_max_unlock,
+    result = {
+        "lucky_guess": dict(zip(model.item_ids, guess)),
+        "careless_error": dict(zip(model.item_ids, slip)),
+        "prior": dict(zip(model.state_ids, prior)),
+        "log_likelihood": log_lik,
+        "iterations": iteration,
+        "converged": converged,
     }
+    if apply:
+        for item in graph["items"]:
+            j = model.item_index[item["id"]]
+            item["blim_parameters"] = {"lucky_guess": round(guess[j], 6),
+                                       "careless_error": round(slip[j], 6)}
+        if isinstance(graph.get("knowledge_states"), StateTable):
+            graph["knowledge_states"] = list(graph["knowledge_states"])
+        for ks, p in zip(graph.get("knowledge_states", []), prior):
+            ks["prior_probability"] = p
+    return result
 
-    for name, scorer in scorers.items():
-        path = build_path(scorer)
-        if path:
-            paths.append(path)
 
-    return paths[:max_paths]
+class _EmStats:
+    """Sufficient statistics of one EM E-step (summable across chunks)."""
 
+    def __init__(self, n_states: int, n_items: int):
+        self.prior = [0.0] * n_states
+        self.in_total = [0.0] * n_items     # expected responses from masters
+        self.in_correct = [0.0] * n_items   # ... of which correct
+        self.out_total = [0.0] * n_items    # expected responses from non-masters
+        self.out_correct = [0.0] * n_items  # ... of which correct (guesses)
+        self.log_lik = 0.0
+        self.n_students = 0
 
-# ---------------------------------------------------------------------------
-# BLIM — Bayesian Assessment
-# ---------------------------------------------------------------------------
+    def merge(self, other: "_EmStats") -> None:
+        for name in ("prior", "in_total", "in_correct", "out_total", "out_correct"):
+            setattr(self, name, list(map(add, getattr(self, name), getattr(other, name))))
+        self.log_lik += other.log_lik
+        self.n_students += other.n_students
 
-def blim_update(
-    state_probs: dict[str, float],
-    states: dict[str, set[str]],
-    item_id: str,
-    response_correct: bool,
-    lucky_guess: float = 0.1,
-    careless_error: float = 0.1
-) -> dict[str, float]:
-    """
-    Bayesian update of knowledge state probabilities given a response.
 
-    Parameters:
-    - state_probs: {state_id: probability} current distribution
-    - states: {state_id: set of item IDs in that state}
-    - item_id: which item was assessed
-    - response_correct: whether the student answered correctly
-    - lucky_guess (g): P(correct | not mastered)
-    - careless_error (s): P(incorrect | mastered)
+def _chunked(iterable: Iterable, size: int) -> Iterator[list]:
+    it = iter(iterable)
+    while True:
+        chunk = list(islice(it, size))
+        if not chunk:
+            return
+        yield chunk
 
-    Returns updated state probabilities (normalized).
-    """
-    updated = {}
-    for sid, prob in state_probs.items():
-        item_in_state = item_id in states[sid]
-        if response_correct:
-            likelihood = (1 - careless_error) if item_in_state else lucky_guess
-        else:
-            likelihood = careless_error if item_in_state else (1 - lucky_guess)
-        updated[sid] = prob * likelihood
 
-    # Normalize
-    total = sum(updated.values())
-    if total > 0:
-        for sid in updated:
-            updated[sid] /= total
-    return updated
+def _encode_patterns(model: BlimModel, chunk: list) -> list[list[tuple[int, bool]]]:
+    """Map item IDs to model columns, dropping responses to unknown items."""
+    index = model.item_index
+    return [[(index[iid], correct) for iid, correct in pattern if iid in index]
+            for _, pattern in chunk]
 
 
-def select_assessment_item(
-    state_probs: dict[str, float],
-    states: dict[str, set[str]],
-    assessed_items: set[str],
-    all_item_ids: set[str]
-) -> str | None:
-    """
-    Select the next item to assess for maximum information gain.
+def _em_chunk_stats(model: BlimModel, prior: list[float], guess: list[float],
+                    slip: list[float], chunk: list[list[tuple[int, bool]]]) -> _EmStats:
+    """E-step for one chunk of encoded response patterns."""
+    n_states, n_items = len(model), len(model.item_ids)
+    stats = _EmStats(n_states, n_items)
+    chunk = [pattern for pattern in chunk if pattern]
+    stats.n_students = len(chunk)
+    if not chunk:
+        return stats
+    log_g = [math.log(g) for g in guess]
+    log_ng = [math.log(1 - g) for g in guess]
+    log_s = [math.log(s) for s in slip]
+    log_ns = [math.log(1 - s) for s in slip]
 
-    Heuristic: choose the item where ~50% of probability mass has it
-    mastered and ~50% doesn't (maximum discrimination).
-    """
-    best_item = None
-    best_score = float("inf")  # Closest to 0.5
+    if model.use_numpy:
+        # log P(pattern | K) = const + sum_j delta[j] * [j in K]
+        delta = np.zeros((len(chunk), n_items))
+        const = np.zeros(len(chunk))
+        n_correct = np.zeros((len(chunk), n_items))
+        n_total = np.zeros((len(chunk), n_items))
+        for row, pattern in enumerate(chunk):
+            for j, correct in pattern:
+                if correct:
+                    const[row] += log_g[j]
+                    delta[row, j] += log_ns[j] - log_g[j]
+                    n_correct[row, j] += 1
+                else:
+                    const[row] += log_ng[j]
+                    delta[row, j] += log_s[j] - log_ng[j]
+                n_total[row, j] += 1
+        incidence = model.incidence.astype(np.float64)
+        with np.errstate(divide="ignore"):
+            log_post = const[:, None] + delta @ incidence + np.log(np.asarray(prior))
+        peak = log_post.max(axis=1, keepdims=True)
+        post = np.exp(log_post - peak)
+        norm = post.sum(axis=1, keepdims=True)
+        post /= norm
+        stats.log_lik = float((np.log(norm) + peak).sum())
+        stats.prior = post.sum(axis=0).tolist()
+        mastery = post @ incidence.T
+        stats.in_total = (n_total * mastery).sum(axis=0).tolist()
+        stats.in_correct = (n_correct * mastery).sum(axis=0).tolist()
+        stats.out_total = (n_total * (1 - mastery)).sum(axis=0).tolist()
+        stats.out_correct = (n_correct * (1 - mastery)).sum(axis=0).tolist()
+        return stats
 
-    for item_id in all_item_ids - assessed_items:
-        prob_mastered = sum(
-            prob for sid, prob in state_probs.items()
-            if item_id in states[sid]
-        )
-        # Score = distance from 0.5 (lower is better)
-        score = abs(prob_mastered - 0.5)
-        if score < best_score:
-            best_score = score
-            best_item = item_id
+    for pattern in chunk:
+        post = array("d", prior)
+        for j, correct in pattern:
+            factors = (guess[j], 1 - slip[j]) if correct else (1 - guess[j], slip[j])
+            post = array("d", map(mul, post, map(factors.__getitem__, model.incidence[j])))
+        norm = math.fsum(post)
+        if norm <= 0:
+            continue
+        stats.log_lik += math.log(norm)
+        post = array("d", map((1.0 / norm).__mul__, post))
+        stats.prior = list(map(add, stats.prior, post))
+        for j, correct in pattern:
+            m = sum(compress(post, model.incidence[j]))
+            stats.in_total[j] += m
+            stats.out_total[j] += 1 - m
+            if correct:
+                stats.in_correct[j] += m
+                stats.out_correct[j] += 1 - m
+    return stats
 
-    return best_item
 
+_EM_WORKER_MODEL: BlimModel | None = None
+
+
+def _em_worker_init(item_ids: list[str], states: list[int], use_numpy: bool) -> None:
+    global _EM_WORKER_MODEL
+    _EM_WORKER_MODEL = BlimModel(item_ids, states, use_numpy=use_numpy)
 
-def entropy(probs: dict[str, float]) -> float:
-    """Compute Shannon entropy of a probability distribution."""
-    import math
-    return -sum(p * math.log2(p) for p in probs.values() if p > 0)
+
+def _em_worker_stats(prior, guess, slip, chunk) -> _EmStats:
+    return _em_chunk_stats(_EM_WORKER_MODEL, prior, guess, slip, chunk)
 
 
 # ---------------------------------------------------------------------------
 # Validation
 # ---------------------------------------------------------------------------
 
-def validate_graph(graph: dict) -> dict[str, list[str]]:
+def validate_graph(graph: dict, workers: int | None = None,
+                   index: SurmiseIndex | None = None) -> dict[str, list[str]]:
     """
     Run validation checks on a knowledge graph.
 
+    Stored knowledge_states are checked for the space axioms (empty set,
+    full domain, closure under union) at any size; workers > 1 spreads the
+    union-closure check over a process pool.
+
     Returns: {"fail": [...], "warn": [...], "pass": [...]}
     """
     results: dict[str, list[str]] = {"fail": [], "warn": [], "pass": []}
@@ -415,6 +3105,18 @@ def validate_graph(graph: dict) -> dict[str, list[str]]:
     else:
         results["pass"].append("Referential integrity: all relation IDs valid")
 
+    # Competence references (CbKST)
+    if graph.get("competences") or any(
+            item.get("required_competences") for item in graph["items"]):
+        unknown = unknown_competence_refs(graph)
+        if unknown:
+            results["fail"].append(
+                f"Competence references: {len(unknown)} required competence(s) "
+                f"not defined: {unknown[:5]}")
+        else:
+            results["pass"].append("Competence references: all required "
+                                   "competences defined")
+
     # Duplicate relations
     pairs = [(r["prerequisite"], r["target"]) for r in graph.get("surmise_relations", [])]
     dupes = len(pairs) - len(set(pairs))
@@ -423,17 +3125,34 @@ def validate_graph(graph: dict) -> dict[str, list[str]]:
     else:
         results["pass"].append("No duplicate relations")
 
+    if index is None:
+        index = SurmiseIndex.from_graph(graph)
+
     # Cycles
-    cycles = detect_cycles(graph)
+    cycles = detect_cycles(graph, index)
     if cycles:
+        breaking = cycle_breaking_edges(graph)
         results["fail"].append(
-            f"Acyclicity: {len(cycles)} cycle(s) detected: {cycles[:3]}")
+            f"Acyclicity: {len(cycles)} cyclic component(s) detected: "
+            f"{cycles[:3]}; removing {len(breaking)} relation(s) breaks "
+            f"every cycle: {breaking[:5]}")
     else:
         results["pass"].append("Acyclicity: no cycles detected")
 
     # Transitivity
-    new_transitive = transitive_closure(graph)
-    if new_transitive:
+    new_transitive = transitive_closure(graph, index)
+    if graph["metadata"].get("relation_storage") == "reduced" and not cycles:
+        redundant = len(graph.get("surmise_relations", [])) - len(
+            transitive_reduction(graph, index))
+        if redundant:
+            results["warn"].append(
+                f"Transitivity: relation is stored reduced but has {redundant} "
+                f"redundant relation(s)")
+        else:
+            results["pass"].append(
+                "Transitivity: relation stored as its transitive reduction "
+                "(closure computed in memory)")
+    elif new_transitive:
         results["warn"].append(
             f"Transitivity: {len(new_transitive)} implied relation(s) missing "
             f"from explicit surmise_relations")
@@ -459,7 +3178,7 @@ def validate_graph(graph: dict) -> dict[str, list[str]]:
 
     # --- Educational plausibility ---
 
-    adj = build_adjacency(graph)
+    adj = build_adjacency(graph, index)
 
     # Max direct prerequisites
     for iid in item_ids:
@@ -502,77 +3221,182 @@ def validate_graph(graph: dict) -> dict[str, list[str]]:
     # Knowledge states validation (if present)
     ks = graph.get("knowledge_states", [])
     if ks:
-        state_sets = [frozenset(s["items"]) for s in ks]
+        if isinstance(ks, StateTable):
+            masks = ks.masks(index.item_ids)
+            unknown_items = set(ks.item_ids) - item_ids
+            unknown = ([s["id"] for s in ks if not set(s["items"]) <= item_ids]
+                       if unknown_items else [])
+        else:
+            masks = [index.mask(s["items"]) for s in ks]
+            unknown = [s["id"] for s in ks if not set(s["items"]) <= item_ids]
+        family = set(masks)
         # Empty set present
-        if frozenset() not in state_sets:
+        if 0 not in family:
             results["warn"].append(
                 "Knowledge states: empty set (novice state) not present")
         # Full set present
-        if frozenset(item_ids) not in state_sets:
+        if index.mask(item_ids) not in family:
             results["warn"].append(
                 "Knowledge states: full domain (expert state) not present")
-        # Union closure (sample check for performance)
-        if len(state_sets) <= 500:
-            state_set = set(state_sets)
-            union_failures = 0
-            for s1, s2 in combinations(state_sets, 2):
-                if (s1 | s2) not in state_set:
-                    union_failures += 1
-                    if union_failures >= 3:
-                        break
-            if union_failures:
-                results["fail"].append(
-                    f"Union closure: {union_failures}+ pair(s) whose union "
-                    f"is not a valid state")
-            else:
-                results["pass"].append("Union closure: verified")
+        # States must only contain domain items
+        if unknown:
+            results["fail"].append(
+                f"Knowledge states: {len(unknown)} state(s) reference "
+                f"non-existent items: {unknown[:5]}")
+        # Union closure, checked against the family's base
+        violations = union_closure_violations(masks, workers)
+        if violations:
+            examples = [(ks[a]["id"], ks[b]["id"]) for a, b in violations[:5]]
+            results["fail"].append(
+                f"Union closure: {len(violations)} pair(s) whose union "
+                f"is not a valid state: {examples}")
+        else:
+            results["pass"].append(
+                f"Union closure: verified over {len(ks)} state(s)")
 
     return results
 
 
+def union_closure_violations(
+    states: list[int],
+    workers: int | None = None,
+    chunk_size: int = 4096
+) -> list[tuple[int, int]]:
+    """
+    Check that a family of bitset states is closed under union.
+
+    Since every state is a union of base states (see compute_base), the
+    family is union-closed iff K | B is a member for every state K and
+    base state B, so only |states| x |base| unions are tested rather
+    than all pairs. With workers > 1 the states are checked in chunks on a
+    process pool.
+
+    Returns every failing (row, row) pair of positions in states, sorted;
+    each is a counterexample whose union is not in the family.
+    """
+    rows: dict[int, int] = {}
+    for row, state in enumerate(states):
+        rows.setdefault(state, row)
+    with profile_phase("compute_base"):
+        base = [(b, rows[b]) for b in compute_base(rows)]
+        profile_count("states", len(rows))
+        profile_count("base_states", len(base))
+    chunks = _chunked(rows.items(), chunk_size)
+    found: set[tuple[int, int]] = set()
+    with profile_phase("union_closure"):
+        if workers and workers > 1:
+            with ProcessPoolExecutor(workers, initializer=_union_worker_init,
+                                     initargs=(rows, base)) as pool:
+                for pairs in pool.map(_union_worker_check, chunks):
+                    found.update(pairs)
+        else:
+            for chunk in chunks:
+                found.update(_union_check(rows, base, chunk))
+        profile_count("pairs_checked", len(rows) * len(base))
+        profile_count("violations", len(found))
+    return sorted(found)
+
+
+def _union_check(family: dict[int, int], base: list[tuple[int, int]],
+                 chunk: list[tuple[int, int]]) -> list[tuple[int, int]]:
+    """Failing (row, row) pairs of one chunk of (state, row) entries."""
+    failed = []
+    for state, row in chunk:
+        for b, b_row in base:
+            if b & ~state and state | b not in family:
+                failed.append((min(row, b_row), max(row, b_row)))
+    return failed
+
+
+_UNION_WORKER_ARGS: tuple | None = None
+
+
+def _union_worker_init(family: dict[int, int],
+                       base: list[tuple[int, int]]) -> None:
+    global _UNION_WORKER_ARGS
+    _UNION_WORKER_ARGS = (family, base)
+
+
+def _union_worker_check(chunk: list[tuple[int, int]]) -> list[tuple[int, int]]:
+    return _union_check(*_UNION_WORKER_ARGS, chunk)
+
+
 # ---------------------------------------------------------------------------
 # Class-Wide Analytics
 # ---------------------------------------------------------------------------
 
-def class_analytics(graph: dict) -> dict[str, Any]:
+def class_analytics(
+    graph: dict,
+    index: SurmiseIndex | None = None,
+    students: Iterable[tuple[str, dict]] | None = None,
+    cluster_by: str = "state",
+    threshold: float = 0.6
+) -> dict[str, Any]:
     """
     Compute class-wide analytics from student states.
 
+    Leverage counts the items an item is (transitively) prerequisite to,
+    read from the closure of a SurmiseIndex, so it is the same whether the
+    relation is stored closed or reduced.
+
+    students is an iterable of (student_id, record) pairs and defaults to
+    graph["student_states"]; it is consumed in one pass and only each
+    record's current_state and outer_fringe are read, so it can be a
+    GraphStream.students() generator.
+
+    Students are clustered by Jaccard similarity >= threshold of their
+    current states (cluster_by='state') or of their outer fringes, i.e.
+    their position in the knowledge lattice (cluster_by='fringe'; computed
+    from the current state when not stored). See cluster_students.
+
     Returns dict with:
     - mastery_rates: {item_id: fraction of students who mastered it}
     - outer_fringe_freq: {item_id: count of students with this in outer fringe}
     - target_scores: {item_id: composite score for instruction targeting}
     - clusters: list of student groups by state similarity
     """
-    students = graph.get("student_states", {})
+    if cluster_by not in ("state", "fringe"):
+        raise ValueError(f"Unknown clustering: {cluster_by}")
+    if students is None:
+        students = graph.get("student_states", {}).items()
+    if index is None:
+        index = SurmiseIndex.from_graph(graph)
     item_ids = {item["id"] for item in graph["items"]}
-    succ = build_successor_map(graph)
-
-    if not students:
-        return {"error": "No student states found"}
+    prereq = index.prereq_mask
 
-    # Mastery rates
+    # Mastery and outer fringe counts, one student at a time
     mastery_counts: dict[str, int] = defaultdict(int)
-    for sid, sdata in students.items():
+    fringe_counts: dict[str, int] = defaultdict(int)
+    features: list[tuple[str, int]] = []
+    for sid, sdata in students:
         state = sdata.get("current_state", [])
-        if isinstance(state, list):
-            for iid in state:
-                mastery_counts[iid] += 1
+        if not isinstance(state, list):
+            state = []
+        for iid in state:
+            mastery_counts[iid] += 1
+        fringe = sdata.get("outer_fringe")
+        for iid in fringe or []:
+            fringe_counts[iid] += 1
+        mask = index.mask(state)
+        if cluster_by == "fringe":
+            if fringe is None:
+                mask = sum(1 << x for x in range(len(prereq))
+                           if not mask >> x & 1 and not prereq[x] & ~mask)
+            else:
+                mask = index.mask(fringe)
+        features.append((sid, mask))
+
+    if not features:
+        return {"error": "No student states found"}
 
-    n_students = len(students)
+    n_students = len(features)
     mastery_rates = {iid: mastery_counts.get(iid, 0) / n_students
                      for iid in item_ids}
 
-    # Outer fringe frequency
-    fringe_counts: dict[str, int] = defaultdict(int)
-    for sid, sdata in students.items():
-        for iid in sdata.get("outer_fringe", []):
-            fringe_counts[iid] += 1
-
     # Leverage: how many items does mastering this unlock?
     leverage = {}
-    for iid in item_ids:
-        leverage[iid] = len(succ.get(iid, set()))
+    for i, desc in enumerate(index.descendants):
+        leverage[index.item_ids[i]] = _popcount(desc & ~(1 << i))
 
     # Composite target score
     target_scores = {}
@@ -582,31 +3406,9 @@ def class_analytics(graph: dict) -> dict[str, Any]:
         need = 1 - mastery_rates.get(iid, 0)
         target_scores[iid] = fringe_freq * (1 + lev) * need
 
-    # Student clustering by Jaccard similarity
-    student_ids = list(students.keys())
-    student_sets = {}
-    for sid in student_ids:
-        state = students[sid].get("current_state", [])
-        student_sets[sid] = set(state) if isinstance(state, list) else set()
-
-    # Simple greedy clustering (for small class sizes)
-    clusters = []
-    assigned = set()
-    for sid in student_ids:
-        if sid in assigned:
-            continue
-        cluster = [sid]
-        assigned.add(sid)
-        for other in student_ids:
-            if other in assigned:
-                continue
-            s1, s2 = student_sets[sid], student_sets[other]
-            union = s1 | s2
-            jaccard = len(s1 & s2) / len(union) if union else 1.0
-            if jaccard >= 0.6:
-                cluster.append(other)
-                assigned.add(other)
-        clusters.append(cluster)
+    profile_count("students", n_students)
+    with profile_phase("cluster_students"):
+        clusters = cluster_students(features, len(index), threshold)
 
     return {
         "mastery_rates": mastery_rates,
@@ -618,30 +3420,715 @@ def class_analytics(graph: dict) -> dict[str, Any]:
     }
 
 
+def _jaccard(a: int, b: int) -> float:
+    union = a | b
+    return _popcount(a & b) / _popcount(union) if union else 1.0
+
+
+def cluster_students(
+    features: Iterable[tuple[str, int]],
+    n_bits: int,
+    threshold: float = 0.6,
+    method: str = "auto",
+    bands: int = 20,
+    rows: int = 3,
+    exact_limit: int = 2000,
+    max_candidates: int = 1000,
+    seed: int = 0
+) -> list[list[str]]:
+    """
+    Leader clustering of (student_id, bitmask) pairs by Jaccard similarity.
+
+    Students with identical masks are grouped first. Distinct masks are
+    then visited in a fixed order (most students first, ties by mask
+    value), and each unassigned mask leads a cluster that takes every
+    unassigned mask with Jaccard >= threshold to it, computed with
+    popcounts. The result therefore does not depend on the input order.
+
+    Candidates for a leader are all other masks (method='exact') or those
+    sharing a MinHash/LSH bucket with it (method='lsh'): bands x rows
+    seeded min-hashes, so a pair at the default threshold collides with
+    probability above 0.99 while the work stays near-linear. A leader
+    compares against at most max_candidates of them, those sharing the
+    most buckets with it (the likeliest to be similar), so large buckets
+    of near-duplicates cannot make it quadratic. 'auto' uses exact
+    comparison up to exact_limit distinct masks.
+
+    Clusters are returned largest first, each sorted by student ID.
+    """
+    groups: dict[int, list[str]] = defaultdict(list)
+    for sid, mask in features:
+        groups[mask].append(sid)
+    order = sorted(groups, key=lambda m: (-len(groups[m]), m))
+    if method == "auto":
+        method = "exact" if len(order) <= exact_limit else "lsh"
+    if method not in ("exact", "lsh"):
+        raise ValueError(f"Unknown clustering method: {method}")
+
+    if method == "lsh":
+        rng = random.Random(seed)
+        perms, ranks = [], []  # ranks[h][j]: position of bit j in perms[h]
+        for _ in range(bands * rows):
+            perm = list(range(n_bits))
+            rng.shuffle(perm)
+            rank = [0] * n_bits
+            for r, j in enumerate(perm):
+                rank[j] = r
+            perms.append(perm)
+            ranks.append(rank)
+        buckets: dict[tuple, dict[int, None]] = defaultdict(dict)
+        keys: dict[int, list[tuple]] = {}
+        for mask in order:
+            # The min-hash is the lowest rank among the set bits: O(popcount)
+            # via the rank table, or O(n_bits / popcount) expected by scanning
+            # the permutation until a set bit; use whichever is cheaper.
+            if not mask:
+                sig = [n_bits] * len(perms)
+            elif _popcount(mask) ** 2 <= n_bits:
+                bits = list(_iter_bits(mask))
+                sig = [min(map(rank.__getitem__, bits)) for rank in ranks]
+            else:
+                sig = []
+                for perm in perms:
+                    for r, j in enumerate(perm):
+                        if mask >> j & 1:
+                            sig.append(r)
+                            break
+            keys[mask] = [(b, *sig[b * rows:(b + 1) * rows]) for b in range(bands)]
+            for key in keys[mask]:
+                buckets[key][mask] = None
+
+    assigned: set[int] = set()
+    clusters = []
+    for leader in order:
+        if leader in assigned:
+            continue
+        assigned.add(leader)
+        if method == "exact":
+            candidates = order
+        else:
+            shared: Counter[int] = Counter()
+            for key in keys[leader]:
+                shared.update(buckets[key].keys())
+            del shared[leader]
+            if len(shared) > max_candidates:
+                candidates = heapq.nlargest(max_candidates, shared, key=shared.get)
+            else:
+                candidates = shared
+        members = [leader]
+        for mask in candidates:
+            if mask not in assigned and _jaccard(leader, mask) >= threshold:
+                members.append(mask)
+                assigned.add(mask)
+        if method == "lsh":
+            for mask in members:
+                for key in keys[mask]:
+                    buckets[key].pop(mask, None)
+        clusters.append(sorted(sid for mask in members for sid in groups[mask]))
+    clusters.sort(key=lambda c: (-len(c), c[0]))
+    return clusters
+
+
+# ---------------------------------------------------------------------------
+# Artifact Cache
+# ---------------------------------------------------------------------------
+
+def structure_hash(graph: dict) -> str:
+    """
+    SHA-256 of the graph structure: the item IDs in order (they fix the
+    bit positions) and the set of (prerequisite, target) pairs. Closures,
+    state enumerations and fringes depend on nothing else.
+    """
+    pairs = sorted({(rel["prerequisite"], rel["target"])
+                    for rel in graph.get("surmise_relations", [])})
+    doc = [[item["id"] for item in graph["items"]], pairs]
+    return hashlib.sha256(json.dumps(doc).encode("utf-8")).hexdigest()
+
+
+def content_hash(graph: dict) -> str:
+    """
+    SHA-256 of everything validate_graph reads: items with all their
+    fields, surmise_relations in order, the competence IDs,
+    knowledge_states (the sidecar bytes for a StateTable) and
+    metadata.relation_storage.
+    """
+    h = hashlib.sha256()
+    doc = [graph["items"], graph.get("surmise_relations", []),
+           graph["metadata"].get("relation_storage"),
+           [c["id"] for c in graph.get("competences", [])]]
+    h.update(json.dumps(doc, sort_keys=True).encode("utf-8"))
+    ks = graph.get("knowledge_states", [])
+    if isinstance(ks, StateTable):
+        h.update(ks._mm)
+    else:
+        h.update(json.dumps(ks, sort_keys=True).encode("utf-8"))
+    return h.hexdigest()
+
+
+class ArtifactCache:
+    """
+    Content-addressed on-disk cache of derived artifacts.
+
+    Entries are JSON files named <key>.<artifact>.json, where key is a hash
+    of the inputs the artifact depends on (structure_hash or content_hash),
+    so an edited graph simply misses and stale entries are never read.
+    Artifacts are plain data (dicts, lists, strings, numbers); ints too wide
+    for a JSON double, such as item bitmasks, are stored as {"$int": hex}.
+    Reading an entry never executes code, so a cache directory shared with
+    other users can at worst return wrong artifacts, not run them. Reads
+    refresh an entry's mtime; writes evict least recently used entries
+    until the directory fits in max_bytes.
+
+    With memory_entries > 0 the most recently used artifacts are also kept
+    in memory, for long-running processes (see GraphStore); they are shared
+    objects that callers must not mutate. directory may then be None for a
+    memory-only cache.
+
+    The directory is created on the first put. If it cannot be created or
+    written, one warning is printed and the cache carries on without disk
+    (callers just rebuild their artifacts).
+    """
+
+    def __init__(self, directory: str | None, max_bytes: int = 256 << 20,
+                 memory_entries: int = 0):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.memory_entries = memory_entries
+        self._memory: OrderedDict[tuple[str, str], Any] = OrderedDict()
+
+    @staticmethod
+    def directory_for(graph_path: str) -> str:
+        """$KST_CACHE_DIR, or .kst_cache next to the graph."""
+        return os.environ.get("KST_CACHE_DIR") or os.path.join(
+            os.path.dirname(os.path.abspath(graph_path)), ".kst_cache")
+
+    @classmethod
+    def for_graph(cls, graph_path: str, **kwargs: Any) -> "ArtifactCache":
+        """The cache in $KST_CACHE_DIR, or .kst_cache next to the graph."""
+        return cls(cls.directory_for(graph_path), **kwargs)
+
+    def _path(self, key: str, artifact: str) -> str:
+        return os.path.join(self.directory, f"{key}.{artifact}.json")
+
+    def get(self, key: str, artifact: str,
+            decode: Callable[[Any], Any] | None = None) -> Any:
+        """
+        Return the cached artifact, or None on a miss. decode turns the
+        stored plain data back into the artifact.
+        """
+        value = self._memory.get((key, artifact))
+        if value is not None:
+            self._memory.move_to_end((key, artifact))
+            return value
+        if self.directory is None:
+            return None
+        path = self._path(key, artifact)
+        try:
+            with open(path, encoding="utf-8") as f:
+                value = json.load(f, object_hook=_decode_wide_int)
+        except (OSError, ValueError):
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass  # readable but not writable: still a hit, just not refreshed
+        if decode is not None:
+            value = decode(value)
+        self._remember(key, artifact, value)
+        return value
+
+    def put(self, key: str, artifact: str, value: Any,
+            encode: Callable[[Any], Any] | None = None) -> None:
+        """
+        Store an artifact and evict old entries beyond max_bytes. encode
+        turns the artifact into plain data for the disk entry.
+        """
+        self._remember(key, artifact, value)
+        if self.directory is None:
+            return
+        data = _encode_wide_ints(encode(value) if encode is not None else value)
+        path = self._path(key, artifact)
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(path + ".tmp", "w", encoding="utf-8") as f:
+                json.dump(data, f, separators=(",", ":"))
+            os.replace(path + ".tmp", path)
+            self._evict(keep=path)
+        except OSError as e:
+            print(f"WARNING: Artifact cache disabled ({e})", file=sys.stderr)
+            self.directory = None
+
+    def fetch(self, key: str, artifact: str, build: Callable[[], Any],
+              encode: Callable[[Any], Any] | None = None,
+              decode: Callable[[Any], Any] | None = None) -> Any:
+        """Return the cached artifact, building and storing it on a miss."""
+        value = self.get(key, artifact, decode)
+        if value is None:
+            profile_count("cache_misses")
+            value = build()
+            self.put(key, artifact, value, encode)
+        else:
+            profile_count("cache_hits")
+        return value
+
+    def clear(self) -> None:
+        self._memory.clear()
+        if self.directory is not None and os.path.isdir(self.directory):
+            for name in os.listdir(self.directory):
+                os.remove(os.path.join(self.directory, name))
+
+    def _remember(self, key: str, artifact: str, value: Any) -> None:
+        if self.memory_entries:
+            self._memory[(key, artifact)] = value
+            self._memory.move_to_end((key, artifact))
+            while len(self._memory) > self.memory_entries:
+                self._memory.popitem(last=False)
+
+    def _evict(self, keep: str) -> None:
+        entries = []
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            st = os.stat(path)
+            entries.append((st.st_mtime, st.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if path != keep:
+                os.remove(path)
+                total -= size
+
+
+_JSON_SAFE_INT = 1 << 53
+
+
+def _encode_wide_ints(value: Any) -> Any:
+    """Copy of value with ints beyond +-2**53 replaced by {"$int": hex}."""
+    if isinstance(value, int) and not isinstance(value, bool):
+        if -_JSON_SAFE_INT < value < _JSON_SAFE_INT:
+            return value
+        return {"$int": format(value, "x")}
+    if isinstance(value, (list, tuple)):
+        return [_encode_wide_ints(v) for v in value]
+    if isinstance(value, dict):
+        return {k: _encode_wide_ints(v) for k, v in value.items()}
+    return value
+
+
+def _decode_wide_int(obj: dict) -> Any:
+    if len(obj) == 1 and "$int" in obj:
+        return int(obj["$int"], 16)
+    return obj
+
+
+def cached_index(graph: dict, cache: ArtifactCache | None) -> SurmiseIndex:
+    """SurmiseIndex of graph, from cache when its structure is unchanged."""
+    if cache is None:
+        return SurmiseIndex.from_graph(graph)
+    return cache.fetch(structure_hash(graph), "index",
+                       lambda: SurmiseIndex.from_graph(graph),
+                       SurmiseIndex.to_dict, SurmiseIndex.from_dict)
+
+
+def cached_fringe_index(graph: dict, cache: ArtifactCache | None,
+                        index: SurmiseIndex | None = None,
+                        max_states: int | None = None) -> FringeIndex:
+    """FringeIndex of graph (see FringeIndex.from_graph), cached by structure."""
+    if index is None:
+        index = cached_index(graph, cache)
+    if cache is None:
+        return FringeIndex.from_graph(graph, index, max_states)
+
+    built = []
+
+    def build():
+        fi = FringeIndex.from_graph(graph, index, max_states)
+        built.append(fi)
+        return fi.states, fi.inner, fi.outer, fi.truncated
+
+    rows = cache.fetch(structure_hash(graph), f"fringes-{max_states}", build)
+    if built:
+        return built[0]
+    if rows[3]:
+        _warn_enumeration_stopped(max_states)  # as the enumeration that built it did
+    return FringeIndex(index, *rows)
+
+
+# ---------------------------------------------------------------------------
+# Serve and Batch Modes
+# ---------------------------------------------------------------------------
+
+class GraphStore:
+    """
+    Parsed graphs and derived artifacts kept warm between commands.
+
+    graph(path) re-reads a file only when the (mtime, size) of the JSON or
+    its state-table sidecar changed, and re-parses it only when the bytes
+    hash differently, so a touched but unchanged file costs one hash.
+    cache(path) returns one ArtifactCache per cache directory that keeps
+    the most recently used artifacts in memory, over the on-disk cache
+    unless disk_cache is false.
+
+    Commands get the stored graph object itself; those that save it change
+    the file, so the next command re-reads it.
+    """
+
+    def __init__(self, disk_cache: bool = True, memory_entries: int = 64):
+        self.disk_cache = disk_cache
+        self.memory_entries = memory_entries
+        self.loads = 0
+        self._graphs: dict[str, tuple[tuple, str, dict]] = {}
+        self._caches: dict[str, ArtifactCache] = {}
+
+    @staticmethod
+    def _stamp(path: str) -> tuple:
+        st = os.stat(path)
+        sidecar = os.path.splitext(path)[0] + ".kstb"
+        try:
+            side = os.stat(sidecar)
+            return st.st_mtime_ns, st.st_size, side.st_mtime_ns, side.st_size
+        except OSError:
+            return st.st_mtime_ns, st.st_size
+
+    def graph(self, path: str) -> dict:
+        """The parsed graph at path, reloaded only if the file changed."""
+        path = os.path.abspath(path)
+        stamp = self._stamp(path)
+        entry = self._graphs.get(path)
+        if entry is not None and entry[0] == stamp:
+            return entry[2]
+        with profile_phase("load_graph"):
+            with open(path, "rb") as f:
+                data = f.read()
+            profile_count("bytes", len(data))
+            digest = hashlib.sha256(data).hexdigest()
+            if entry is not None and entry[1] == digest and stamp[2:] == entry[0][2:]:
+                graph = entry[2]
+            else:
+                graph = _attach_state_table(json.loads(data), path)
+                self.loads += 1
+        self._graphs[path] = (stamp, digest, graph)
+        return graph
+
+    def cache(self, path: str) -> ArtifactCache:
+        """The memory-backed artifact cache for the graph at path."""
+        directory = ArtifactCache.directory_for(path) if self.disk_cache else ""
+        if directory not in self._caches:
+            self._caches[directory] = ArtifactCache(
+                directory or None, memory_entries=self.memory_entries)
+        return self._caches[directory]
+
+    def discard(self, path: str) -> None:
+        """Forget the graph at path, so the next graph(path) re-reads it."""
+        self._graphs.pop(os.path.abspath(path), None)
+
+    def clear(self) -> None:
+        """Forget every graph and in-memory artifact (disk caches are kept)."""
+        self._graphs.clear()
+        self._caches.clear()
+
+    def status(self) -> dict[str, Any]:
+        return {"graphs": sorted(self._graphs), "loads": self.loads,
+                "cached_artifacts": sum(len(c._memory) for c in self._caches.values())}
+
+
+def execute(store: GraphStore, args: list[str]) -> dict[str, Any]:
+    """
+    Run one command (args as on the command line, without the program name)
+    against store, capturing its output.
+
+    Returns {"exit_code", "stdout", "stderr"}. Commands are not thread-safe
+    (output capture and profiling are process-wide); callers serialize them.
+    """
+    out, err = io.StringIO(), io.StringIO()
+    with redirect_stdout(out), redirect_stderr(err):
+        code = run_command(["kst_utils.py", *args], store)
+    return {"exit_code": code, "stdout": out.getvalue(), "stderr": err.getvalue()}
+
+
+def run_batch(store: GraphStore, lines: Iterable[str]) -> int:
+    """
+    Run one command line per input line (shell quoting, blank lines and
+    #-comments allowed), printing each command's output as it would be
+    printed on its own. Returns 1 if any command failed, else 0.
+    """
+    status = 0
+    for lineno, line in enumerate(lines, 1):
+        args = shlex.split(line, comments=True)
+        if not args:
+            continue
+        if args[0] in ("serve", "batch"):
+            print(f"ERROR: line {lineno}: {args[0]} cannot be nested", file=sys.stderr)
+            status = 1
+            continue
+        try:
+            code = run_command(["kst_utils.py", *args], store)
+        except Exception as e:
+            print(f"ERROR: line {lineno}: {type(e).__name__}: {e}", file=sys.stderr)
+            code = 1
+        sys.stdout.flush()
+        status = status or int(code != 0)
+    return status
+
+
+_RPC_COMMANDS = ("validate", "closure", "enumerate", "count", "base",
+                 "competences", "paths", "analytics", "cycles", "fit", "stats")
+
+
+class _Shutdown(Exception):
+    pass
+
+
+def handle_rpc(store: GraphStore, line: str) -> dict | None:
+    """
+    Answer one JSON-RPC 2.0 request line; None for notifications.
+
+    Methods are the CLI commands, with params either a list of CLI
+    arguments (graph path first) or {"graph": path, "args": [...]}, and
+    return execute()'s result. "status" reports the loaded graphs, "reload"
+    forgets them, and "shutdown" stops the server after replying.
+    """
+    try:
+        request = json.loads(line)
+    except ValueError as e:
+        return {"jsonrpc": "2.0", "id": None,
+                "error": {"code": -32700, "message": f"Parse error: {e}"}}
+    if not isinstance(request, dict) or not isinstance(request.get("method"), str):
+        return {"jsonrpc": "2.0", "id": None,
+                "error": {"code": -32600, "message": "Invalid request"}}
+    rid, method = request.get("id"), request["method"]
+    params = request.get("params", [])
+
+    def reply(result=None, error=None):
+        if "id" not in request:
+            return None
+        if error is not None:
+            return {"jsonrpc": "2.0", "id": rid, "error": error}
+        return {"jsonrpc": "2.0", "id": rid, "result": result}
+
+    if method == "status":
+        return reply(store.status())
+    if method == "reload":
+        store.clear()
+        return reply(store.status())
+    if method == "shutdown":
+        raise _Shutdown(reply(True))
+    if method not in _RPC_COMMANDS:
+        return reply(error={"code": -32601, "message": f"Unknown method: {method}"})
+    if isinstance(params, dict):
+        args = [params.get("graph", ""), *params.get("args", [])]
+    elif isinstance(params, list):
+        args = params
+    else:
+        return reply(error={"code": -32602, "message": "Invalid params"})
+    try:
+        return reply(execute(store, [method, *map(str, args)]))
+    except Exception as e:
+        return reply(error={"code": -32000, "message": f"{type(e).__name__}: {e}"})
+
+
+def serve_stdio(store: GraphStore, lines: Iterable[str], out: Any) -> None:
+    """Serve newline-delimited JSON-RPC requests from lines, replying on out."""
+    for line in lines:
+        if not line.strip():
+            continue
+        stop = False
+        try:
+            response = handle_rpc(store, line)
+        except _Shutdown as e:
+            response, stop = e.args[0], True
+        if response is not None:
+            out.write(json.dumps(response) + "\n")
+            out.flush()
+        if stop:
+            return
+
+
+def remove_stale_socket(path: str) -> None:
+    """
+    Remove a socket file left behind at path by an earlier server. Raises
+    ValueError if path exists but is not a socket, rather than deleting it.
+    """
+    try:
+        mode = os.lstat(path).st_mode
+    except FileNotFoundError:
+        return
+    if not stat.S_ISSOCK(mode):
+        raise ValueError(f"Refusing to replace {path}: not a socket")
+    os.remove(path)
+
+
+def serve_socket(store: GraphStore, path: str) -> None:
+    """
+    Serve newline-delimited JSON-RPC on a Unix socket at path. Each
+    connection is handled on its own thread; commands run one at a time.
+    """
+    lock = threading.Lock()
+
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            for raw in self.rfile:
+                line = raw.decode("utf-8")
+                if not line.strip():
+                    continue
+                stop = None
+                with lock:
+                    try:
+                        response = handle_rpc(store, line)
+                    except _Shutdown as e:
+                        response, stop = e.args[0], e
+                if response is not None:
+                    self.wfile.write((json.dumps(response) + "\n").encode("utf-8"))
+                    self.wfile.flush()
+                if stop is not None:
+                    threading.Thread(target=self.server.shutdown).start()
+                    return
+
+    remove_stale_socket(path)
+    with socketserver.ThreadingUnixStreamServer(path, Handler) as server:
+        server.daemon_threads = True
+        print(f"Serving on {path}", file=sys.stderr)
+        try:
+            server.serve_forever()
+        finally:
+            os.remove(path)
+
+
 # ---------------------------------------------------------------------------
 # CLI Interface
 # ---------------------------------------------------------------------------
 
 def main():
-    if len(sys.argv) < 3:
+    if len(sys.argv) > 1 and sys.argv[1] in ("serve", "batch"):
+        store = GraphStore(disk_cache="--no-cache" not in sys.argv)
+        if sys.argv[1] == "batch":
+            sys.exit(run_batch(store, sys.stdin))
+        if "--socket" in sys.argv:
+            try:
+                serve_socket(store, sys.argv[sys.argv.index("--socket") + 1])
+            except ValueError as e:
+                print(f"Error: {e}", file=sys.stderr)
+                sys.exit(1)
+        else:
+            serve_stdio(store, sys.stdin, sys.stdout)
+        return
+    sys.exit(run_command(sys.argv))
+
+
+_CACHED_COMMANDS = {"validate", "closure", "enumerate", "count", "competences",
+                    "base", "paths", "cycles"}
+
+
+def run_command(argv: list[str], store: "GraphStore | None" = None) -> int:
+    """
+    Run one command given as a full argument vector (argv[0] is the program
+    name) and return its exit code. Graphs and derived artifacts come from
+    store when given (see GraphStore) instead of being read from disk.
+
+    With --profile, phases are recorded and written as a Chrome trace to
+    --profile-output (default kst_profile.json), and a per-phase summary
+    is printed to stderr.
+
+    Commands edit the stored graph in place before saving it, so if one
+    raises (e.g. the save fails) the graph is dropped from store and the
+    next command reads the file again.
+    """
+    profiler = None
+    if "--profile" in argv:
+        profiler = Profiler()
+        set_profiler(profiler)
+    try:
+        with profile_phase(f"command.{argv[1]}" if len(argv) > 1 else "command"):
+            _run_command(argv, store)
+    except SystemExit as e:
+        return e.code if isinstance(e.code, int) else int(e.code is not None)
+    except BaseException:
+        if store is not None and len(argv) > 2:
+            store.discard(argv[2])
+        raise
+    finally:
+        if profiler is not None:
+            set_profiler(None)
+            output = "kst_profile.json"
+            if "--profile-output" in argv:
+                output = argv[argv.index("--profile-output") + 1]
+            with open(output, "w") as f:
+                json.dump(profiler.chrome_trace(argv=argv[1:]), f, indent=2)
+            print_profile(profiler, sys.stderr)
+            print(f"Profile written to {output}", file=sys.stderr)
+    return 0
+
+
+def print_profile(profiler: Profiler, file: Any = None) -> None:
+    """Print one line per phase: calls, total time and counters."""
+    for name, entry in sorted(profiler.summary().items(),
+                              key=lambda kv: -kv[1]["seconds"]):
+        counters = " ".join(f"{k}={v}" for k, v in entry.items()
+                            if k not in ("calls", "seconds"))
+        print(f"  {name:<24} {entry['calls']:>5}x {entry['seconds']:10.4f}s  {counters}",
+              file=file)
+
+
+def _run_command(argv: list[str], store: "GraphStore | None" = None):
+    if len(argv) < 3:
         print("Usage: python3 kst_utils.py <command> <graph-path> [options]")
+        print("       python3 kst_utils.py serve [--socket PATH] [--no-cache]")
+        print("       python3 kst_utils.py batch [--no-cache] < commands.txt")
         print()
         print("Commands:")
         print("  validate          Run validation checks")
         print("  closure           Compute transitive closure")
         print("  enumerate         Enumerate knowledge states")
+        print("  count             Count (and sample) knowledge states")
+        print("  base              Compute the base and atoms of the space")
+        print("  competences       Derive knowledge states from competences (CbKST)")
         print("  paths             Generate learning paths")
         print("  analytics         Compute class-wide analytics")
         print("  cycles            Detect cycles in surmise relation")
+        print("  fit               Fit BLIM parameters from assessment logs")
         print("  stats             Print graph statistics")
+        print()
+        print("Commands that save accept --binary to store knowledge_states in a")
+        print("memory-mapped .kstb sidecar next to the JSON. Derived artifacts are")
+        print("cached in .kst_cache next to the graph ($KST_CACHE_DIR overrides;")
+        print("--no-cache disables).")
+        print()
+        print("--profile records per-phase wall time, call counts and sizes as a")
+        print("Chrome trace (--profile-output PATH, default kst_profile.json).")
+        print()
+        print("serve answers newline-delimited JSON-RPC 2.0 requests on stdio (or a")
+        print("Unix socket) and batch runs one command line per stdin line; both")
+        print("keep parsed graphs and derived artifacts in memory between commands.")
         sys.exit(1)
 
-    command = sys.argv[1]
-    graph_path = sys.argv[2]
-    graph = load_graph(graph_path)
+    command = argv[1]
+    graph_path = argv[2]
+    stream = None
+    if store is not None:
+        graph = store.graph(graph_path)
+    elif command in ("stats", "analytics"):
+        stream = GraphStream(graph_path)
+        graph = stream.sections(["metadata", "items", "surmise_relations"])
+    else:
+        graph = load_graph(graph_path)
+    binary = True if "--binary" in argv else None
+    if "--no-cache" in argv or command not in _CACHED_COMMANDS:
+        cache = None
+    elif store is not None:
+        cache = store.cache(graph_path)
+    else:
+        cache = ArtifactCache.for_graph(graph_path)
 
     if command == "validate":
-        results = validate_graph(graph)
+        workers = None
+        if "--workers" in argv:
+            workers = int(argv[argv.index("--workers") + 1])
+        if cache is None:
+            results = validate_graph(graph, workers)
+        else:
+            results = cache.fetch(
+                content_hash(graph), "validation",
+                lambda: validate_graph(graph, workers, cached_index(graph, cache)))
         for level in ["fail", "warn", "pass"]:
             for msg in results[level]:
                 print(f"[{level.upper()}] {msg}")
@@ -652,46 +4139,126 @@ def main():
         sys.exit(1 if n_fail > 0 else 0)
 
     elif command == "closure":
-        new_rels = transitive_closure(graph)
+        if "--reduce" in argv:
+            try:
+                kept = transitive_reduction(graph, cached_index(graph, cache))
+            except ValueError as e:
+                print(f"FAIL: {e}")
+                sys.exit(1)
+            n_removed = len(graph.get("surmise_relations", [])) - len(kept)
+            print(f"Transitive reduction: {len(kept)} relation(s), "
+                  f"{n_removed} redundant")
+            if "--apply" in argv:
+                graph["surmise_relations"] = kept
+                graph["metadata"]["relation_storage"] = "reduced"
+                save_graph(graph, graph_path, binary)
+                print(f"Removed {n_removed} relations from graph.")
+            return
+        new_rels = transitive_closure(graph, cached_index(graph, cache))
         if new_rels:
             print(f"Found {len(new_rels)} missing transitive relations:")
             for r in new_rels:
                 print(f"  {r['prerequisite']} -> {r['target']}")
-            if "--apply" in sys.argv:
+            if "--apply" in argv:
                 graph["surmise_relations"].extend(new_rels)
-                save_graph(graph, graph_path)
+                graph["metadata"]["relation_storage"] = "closed"
+                save_graph(graph, graph_path, binary)
                 print(f"Applied {len(new_rels)} relations to graph.")
         else:
             print("Relation is already transitively closed.")
 
     elif command == "enumerate":
         max_states = 10000
-        if "--max" in sys.argv:
-            idx = sys.argv.index("--max")
-            max_states = int(sys.argv[idx + 1])
-        states = enumerate_downsets(graph, max_states)
-        print(f"Enumerated {len(states)} feasible knowledge states")
+        if "--max" in argv:
+            idx = argv.index("--max")
+            max_states = int(argv[idx + 1])
+        fringe_index = cached_fringe_index(graph, cache, max_states=max_states)
+        n_states = len(fringe_index)
+        print(f"Enumerated {n_states} feasible knowledge states")
         print(f"Domain size: {len(graph['items'])} items")
-        print(f"Density: {len(states)} / {2**len(graph['items'])} = "
-              f"{len(states) / (2**len(graph['items'])):.4f}")
-        if "--save" in sys.argv:
-            item_ids = {item["id"] for item in graph["items"]}
-            all_states_set = set(states)
-            ks = []
-            for i, state in enumerate(states):
-                inner, outer = compute_fringes(state, all_states_set, item_ids)
-                ks.append({
-                    "id": f"state-{i:04d}",
-                    "items": sorted(state),
-                    "inner_fringe": inner,
-                    "outer_fringe": outer
-                })
-            graph["knowledge_states"] = ks
-            save_graph(graph, graph_path)
+        print(f"Density: {n_states} / {2**len(graph['items'])} = "
+              f"{n_states / (2**len(graph['items'])):.4f}")
+        if "--save" in argv:
+            fringe_index.sort()
+            graph["knowledge_states"] = fringe_index.knowledge_states()
+            save_graph(graph, graph_path, binary)
+
+    elif command == "count":
+        n_items = len(graph["items"])
+        index = cached_index(graph, cache)
+        n_states = count_states(graph, index)
+        print(f"Feasible knowledge states: {n_states}")
+        print(f"Domain size: {n_items} items")
+        print(f"Density: {n_states} / {2**n_items} = {n_states / 2**n_items:.4g}")
+        if "--sample" in argv:
+            k = int(argv[argv.index("--sample") + 1])
+            seed = None
+            if "--seed" in argv:
+                seed = int(argv[argv.index("--seed") + 1])
+            for state in sample_states(graph, k, seed, index):
+                print(f"  {{{', '.join(sorted(state))}}}")
+
+    elif command == "competences":
+        try:
+            structure = CompetenceStructure(graph, cached_index(graph, cache))
+        except ValueError as e:
+            print(f"FAIL: {e}")
+            sys.exit(1)
+        if not len(structure.competences):
+            print("No competences defined.")
+            sys.exit(1)
+        max_states = 10000
+        if "--max" in argv:
+            max_states = int(argv[argv.index("--max") + 1])
+        n_comp_states = count_states({}, structure.competences)
+        fringe_index = structure.fringe_index(max_states)
+        print(f"Competences: {len(structure.competences)}")
+        print(f"Competence states: {n_comp_states}")
+        print(f"Derived knowledge states: {len(fringe_index)}")
+        if "--save" in argv:
+            fringe_index.sort()
+            graph["knowledge_states"] = fringe_index.knowledge_states()
+            save_graph(graph, graph_path, binary)
+
+    elif command == "base":
+        kb = KnowledgeBase.from_graph(graph, cached_index(graph, cache))
+        n_states = len(graph.get("knowledge_states", []))
+        print(f"Base: {len(kb)} state(s)"
+              + (f" spanning {n_states} stored state(s)" if n_states else ""))
+        for iid, atoms in zip(kb.item_ids, kb.atoms):
+            print(f"  {iid}: {len(atoms)} atom(s)")
+        if "--save" in argv:
+            graph["state_base"] = kb.state_base()
+            if "--drop-states" in argv:
+                graph.pop("knowledge_states", None)
+            save_graph(graph, graph_path, binary)
 
     elif command == "paths":
-        states = enumerate_downsets(graph)
-        paths = generate_learning_paths(graph, states)
+        start = None
+        if "--student" in argv:
+            sid = argv[argv.index("--student") + 1]
+            start = graph.get("student_states", {}).get(sid, {}).get("current_state", [])
+            if isinstance(start, str):
+                start = next((s["items"] for s in graph.get("knowledge_states", [])
+                              if s["id"] == start), [])
+        if "--optimal" in argv:
+            k = 3
+            if "--k" in argv:
+                k = int(argv[argv.index("--k") + 1])
+            cost = "topic-switch"
+            if "--cost" in argv:
+                cost = argv[argv.index("--cost") + 1]
+            goal = None
+            if "--goal" in argv:
+                goal = argv[argv.index("--goal") + 1].split(",")
+            best = optimal_learning_paths(graph, k, cost, start=start, goal=goal,
+                                          index=cached_index(graph, cache))
+            for i, (total, path) in enumerate(best):
+                print(f"\noptimal-{i + 1} ({cost} = {total:g}): {' -> '.join(path)}")
+                print(f"  Length: {len(path)} items")
+            return
+        paths = generate_learning_paths(graph, start=start,
+                                        index=cached_index(graph, cache))
         for i, path in enumerate(paths):
             strategies = ["breadth-first", "depth-first", "max-unlock"]
             name = strategies[i] if i < len(strategies) else f"path-{i}"
@@ -699,7 +4266,12 @@ def main():
             print(f"  Length: {len(path)} items")
 
     elif command == "analytics":
-        results = class_analytics(graph)
+        cluster_by = "state"
+        if "--cluster-by" in argv:
+            cluster_by = argv[argv.index("--cluster-by") + 1]
+        students = (stream.students(["current_state", "outer_fringe"])
+                    if stream is not None else None)
+        results = class_analytics(graph, students=students, cluster_by=cluster_by)
         if "error" in results:
             print(results["error"])
             sys.exit(1)
@@ -715,22 +4287,50 @@ def main():
                   f"fringe_freq={freq}")
 
     elif command == "cycles":
-        cycles = detect_cycles(graph)
+        cycles = detect_cycles(graph, cached_index(graph, cache))
         if cycles:
-            print(f"FAIL: {len(cycles)} cycle(s) detected:")
+            print(f"FAIL: {len(cycles)} cyclic component(s) detected:")
             for c in cycles:
-                print(f"  {' -> '.join(c)}")
+                print(f"  {{{', '.join(c)}}}")
+            breaking = cycle_breaking_edges(graph)
+            print(f"Removing these {len(breaking)} relation(s) breaks every cycle:")
+            for p, t in breaking:
+                print(f"  {p} -> {t}")
             sys.exit(1)
         else:
             print("PASS: No cycles detected (valid quasi-order)")
 
+    elif command == "fit":
+        kwargs = {}
+        for flag, key in (("--iterations", "max_iter"), ("--workers", "workers"),
+                          ("--chunk-size", "chunk_size")):
+            if flag in argv:
+                kwargs[key] = int(argv[argv.index(flag) + 1])
+        result = fit_blim(graph, apply="--apply" in argv, **kwargs)
+        status = "converged" if result["converged"] else "stopped"
+        print(f"EM {status} after {result['iterations']} iteration(s), "
+              f"log-likelihood {result['log_likelihood']:.3f}")
+        for iid in sorted(result["lucky_guess"]):
+            print(f"  {iid}: lucky_guess={result['lucky_guess'][iid]:.3f} "
+                  f"careless_error={result['careless_error'][iid]:.3f}")
+        if "--apply" in argv:
+            save_graph(graph, graph_path, binary)
+
     elif command == "stats":
-        n_items = len(graph["items"])
-        n_rels = len(graph.get("surmise_relations", []))
-        n_states = len(graph.get("knowledge_states", []))
-        n_paths = len(graph.get("learning_paths", []))
-        n_students = len(graph.get("student_states", {}))
-        n_competences = len(graph.get("competences", []))
+        if stream is not None:
+            counts = stream.counts
+        else:
+            counts = {key: len(value) for key, value in graph.items()
+                      if isinstance(value, (list, dict, StateTable))}
+        n_items = counts["items"]
+        n_rels = counts.get("surmise_relations", 0)
+        n_states = counts.get("knowledge_states", 0)
+        table = graph["metadata"].get("state_table")
+        if table and "knowledge_states" not in counts:
+            n_states = len(StateTable(os.path.join(os.path.dirname(graph_path), table)))
+        n_paths = counts.get("learning_paths", 0)
+        n_students = counts.get("student_states", 0)
+        n_competences = counts.get("competences", 0)
         print(f"Domain: {graph['metadata'].get('domain_name', 'unknown')}")
         print(f"Version: {graph['metadata'].get('version', 'unknown')}")
         print(f"Items: {n_items}")